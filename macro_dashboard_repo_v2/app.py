@@ -1,11 +1,14 @@
 
 import os
+import sys
 import json
-import pandas as pd
-from datetime import datetime
-from dash import Dash, dcc, html, Input, Output, State
+import time
+import threading
+from collections import OrderedDict
+_t0 = time.perf_counter()  # import time of the rest of this module, logged at the end
+from flask import jsonify, request, Response
+from dash import Dash, dcc, html, Input, Output, State, ctx
 import dash_bootstrap_components as dbc
-import plotly.express as px
 
 from modules.data_fetch import (
     refresh_all_data,
@@ -15,11 +18,32 @@ from modules.data_fetch import (
     load_cached_bonds_snapshot,
     load_cached_news_items,
     add_email_recipient,
-    list_email_recipients,
+    count_email_recipients,
     send_daily_email_summary,
     ensure_scheduler_started,
+    cache_generation,
+    snapshot_version,
+    load_history,
 )
-from modules.utils import create_card, pct_fmt, bp_fmt
+from modules.jobs import register_job_kind, submit_job, get_job, wait_job, start_job_runner
+from modules.leader import start_leader_election
+from modules.metrics import render_prometheus
+from modules.instruments import instruments, groups, countries
+from modules.lazy import lazy_import, warm, load_times
+from modules.digest import SECTIONS as DIGEST_SECTIONS
+from modules.utils import create_card, macro_rows, bonds_rows, market_rows
+
+# Cold start: by default (STARTUP_MODE=lazy) pandas and the chart/history
+# modules are imported on first use, the first page is served from the cache
+# files, and the warmup refresh runs in a background thread. STARTUP_MODE=eager
+# imports everything and refreshes before the worker accepts requests.
+STARTUP_MODE = os.getenv("STARTUP_MODE", "lazy").lower()
+# Preloaded by the warmup thread once the worker is up
+WARM_IMPORTS = ["pandas", "pyarrow.parquet", "modules.charts", "modules.market_data", "modules.timeseries",
+                "modules.dedup", "feedparser"]
+
+pd = lazy_import("pandas")
+charts = lazy_import("modules.charts")
 
 APP_TITLE = "每日宏观与金融监测面板"
 APP_SUB = "中国 / 美国 / 欧盟｜主要宏观指标、股指、国债收益率与重点新闻（自动每日 08:00 刷新 + 邮件推送）"
@@ -28,14 +52,23 @@ external_stylesheets = [dbc.themes.BOOTSTRAP]
 app = Dash(__name__, external_stylesheets=external_stylesheets, title=APP_TITLE, suppress_callback_exceptions=True)
 server = app.server
 
-# Start scheduler once (08:00 Asia/Shanghai by default)
-ensure_scheduler_started()
+# Only the elected leader process (one per deployment, see modules/leader.py)
+# runs the scheduler, background jobs and refreshes; other workers just read the cache.
+def on_elected_leader():
+    if STARTUP_MODE == "eager":
+        _start_leader()
+    else:
+        threading.Thread(target=_start_leader, name="leader-warmup", daemon=True).start()
 
-# Initial data
-try:
-    refresh_all_data(force_if_stale_minutes=180)
-except Exception as e:
-    print("Warmup refresh failed:", e)
+def _start_leader():
+    # Start scheduler once (08:00 Asia/Shanghai by default); the daily run goes through the job queue
+    ensure_scheduler_started(lambda: submit_job("cron"))
+    start_job_runner()
+    # Initial data, queued like any other refresh so it never overlaps a /cron run
+    # (one is typically what woke the instance); until it lands, pages show the cached snapshot
+    job_id = submit_job("warmup")
+    if STARTUP_MODE == "eager":
+        wait_job(job_id)
 
 def load_all():
     return (
@@ -46,61 +79,107 @@ def load_all():
         load_cached_time_series()
     )
 
-macro, stocks, bonds, news_items, hist = load_all()
-
 # ----- UI builders -----
-def macro_row(country_key, title_cn):
-    block = macro.get(country_key, {})
-    items = []
-    for label, key in [("GDP增速(同比,%)", "gdp_yoy"),
-                       ("CPI(同比,%)", "cpi_yoy"),
-                       ("PPI(同比,%)", "ppi_yoy"),
-                       ("政策利率(%)", "policy_rate")]:
-        v = block.get(key, None)
-        items.append((label, None if v is None else f"{v:.2f}"))
-    return dbc.Col(create_card(title_cn, dict(items)), md=4, xs=12)
-
-def bonds_row(country_key, title_cn):
-    block = bonds.get(country_key, {})
-    items = []
-    for label, k in [("1Y", "1y"), ("5Y", "5y"), ("10Y", "10y")]:
-        v = block.get(k, {})
-        val = v.get("value")
-        chg = v.get("change_bp")
-        s = None
-        if val is not None:
-            s = f"{val:.2f}%"
-            if chg is not None:
-                s += f" ({bp_fmt(chg)})"
-        items.append((label, s))
-    return dbc.Col(create_card(f"{title_cn} 国债收益率", dict(items)), md=4, xs=12)
-
-def stocks_row(country_key, title_cn):
-    block = stocks.get(country_key, {})
+# Each card row is (label, DOM id, display text). The ids let live mode (see
+# /api/live below) patch a single value in place instead of re-rendering.
+def macro_items(macro, country_key):
+    return [(label, f"live-macro-{country_key}-{key}", text) for key, label, text in macro_rows(macro, country_key)]
+
+def bonds_items(bonds, country_key):
+    return [(label, f"live-bonds-{country_key}-{k}", text) for k, label, text in bonds_rows(bonds, country_key)]
+
+def market_items(market, group, country_key):
+    return [(label, f"live-market-{i}", text) for i, label, text in market_rows(market, group, country_key)]
+
+def _card(title, items):
+    return dbc.Col(create_card(title, {l: t for l, _, t in items}, {l: i for l, i, _ in items}), md=4, xs=12)
+
+def macro_row(macro, country_key, title_cn):
+    return _card(title_cn, macro_items(macro, country_key))
+
+def bonds_row(bonds, country_key, title_cn):
+    return _card(f"{title_cn} 国债收益率", bonds_items(bonds, country_key))
+
+def market_row(market, group, country_key, title_cn):
+    # One card per (group, country), rows taken from the instrument registry
+    return _card(f"{title_cn} {groups()[group]['title']}", market_items(market, group, country_key))
+
+def live_values(macro, bonds, stocks):
+    # DOM id -> display text for every live-updatable card value
     items = []
-    for label, k in [("市场A", "mkt1"), ("市场B", "mkt2")]:
-        v = block.get(k, {})
-        lvl = v.get("level")
-        chg = v.get("change_pct")
-        s = None
-        if lvl is not None:
-            s = f"{lvl:,.0f}"
-            if chg is not None:
-                s += f" ({pct_fmt(chg)})"
-        items.append((label, s))
-    return dbc.Col(create_card(f"{title_cn} 主要股指", dict(items)), md=4, xs=12)
-
-def cpi_chart():
+    for k in countries():
+        items += macro_items(macro, k) + bonds_items(bonds, k)
+        items += [x for g in groups() for x in market_items(stocks, g, k)]
+    return {i: (t if t is not None else "—") for _, i, t in items}
+
+def market_sections(market):
+    out = []
+    for group, meta in groups().items():
+        cols = [market_row(market, group, k, name) for k, name in countries().items()
+                if any(i.country == k for i in instruments(group=group))]
+        out += [html.H4(meta["title"]), dbc.Row(cols, className="gy-3"), html.Hr()]
+    return out
+
+def cpi_chart(hist):
     if hist is None or hist.empty:
         return html.Div("暂无历史数据")
-    df = hist.copy()
-    if "date" in df.columns:
-        df["date"] = pd.to_datetime(df["date"], format="%Y").dt.to_period("Y").dt.to_timestamp()
-    melted = df.melt(id_vars=["date"], value_vars=[c for c in df.columns if c != "date"],
-                     var_name="系列", value_name="数值")
-    fig = px.line(melted, x="date", y="数值", color="系列", title="CPI同比（历史）")
-    fig.update_layout(margin=dict(l=10,r=10,t=35,b=10), height=320)
-    return dcc.Graph(figure=fig)
+    def build():
+        df = hist.copy()
+        if "date" in df.columns:
+            df.index = pd.to_datetime(df.pop("date").astype(str), format="%Y")
+        return charts.line_figure(df, "CPI同比（历史）", charts.MAX_POINTS)
+    return dcc.Graph(figure=charts.figures.get(cache_generation(), ("cpi",), build))
+
+# ----- Market trend chart -----
+# Daily closes from the time-series store, rebased to 100 at the start of the
+# visible window. Range buttons and zooming both re-query just that window and
+# downsample it to the chart width, so payloads stay small for long histories.
+TREND_RANGES = [("1M", 31), ("3M", 92), ("1Y", 366), ("5Y", 1827), ("全部", None)]
+
+def trend_section():
+    opts = [{"label": i.label, "value": i.id} for i in instruments()]
+    return html.Div([
+        dbc.Row([
+            dbc.Col(dcc.Dropdown(id="trend-series", options=opts, multi=True,
+                                 value=[i.id for i in instruments(group="stocks")]), md=8, xs=12),
+            dbc.Col(dbc.RadioItems(id="trend-range", options=[{"label": k, "value": k} for k, _ in TREND_RANGES],
+                                   value="1Y", inline=True), md=4, xs=12),
+        ], className="gy-2 mb-2"),
+        dcc.Store(id="trend-width"),
+        dcc.Graph(id="trend-chart", config={"displaylogo": False}),
+    ])
+
+app.clientside_callback("function(_) { return window.innerWidth; }",
+                        Output("trend-width", "data"), Input("trend-range", "value"))
+
+def _trend_window(rng, relayout):
+    if ctx.triggered_id == "trend-chart" and relayout and "xaxis.range[0]" in relayout:
+        return pd.Timestamp(relayout["xaxis.range[0]"]).normalize(), pd.Timestamp(relayout["xaxis.range[1]"]).normalize()
+    days = dict(TREND_RANGES).get(rng)
+    end = pd.Timestamp.now().normalize()
+    return (end - pd.Timedelta(days=days) if days else None), end
+
+@app.callback(
+    Output("trend-chart", "figure"),
+    Input("trend-series", "value"),
+    Input("trend-range", "value"),
+    Input("trend-chart", "relayoutData"),
+    Input("trend-width", "data"),
+)
+def trend_chart(series, rng, relayout, width):
+    series = sorted(series or [])
+    start, end = _trend_window(rng, relayout)
+    n = charts.points_for_width(width)
+    names = {i.id: i.label for i in instruments()}
+    def build():
+        frame = load_history("market", series, start, end) if series else pd.DataFrame()
+        title = "走势（区间起点=100）"
+        # A new range button is a new view: zoom kept from the previous range would hide the re-queried data
+        fig = charts.line_figure(frame, title, n, names, rebase=True, uirevision=f"{title}|{rng}")
+        if not fig["data"]:
+            fig["layout"]["annotations"] = [{"text": "暂无历史数据", "showarrow": False, "xref": "paper", "yref": "paper"}]
+        return fig
+    return charts.figures.get(cache_generation(), ("trend", tuple(series), rng, start, end, n), build)
 
 # --- Email subscribe form ---
 email_form = dbc.Card(
@@ -110,6 +189,11 @@ email_form = dbc.Card(
             dbc.Col(dbc.Input(id="email-input", type="email", placeholder="输入你的邮箱，例如 name@example.com"), md=8, xs=12),
             dbc.Col(dbc.Button("订阅", id="email-submit", color="primary"), md=4, xs=12),
         ], className="gy-2"),
+        # Digest preferences; subscribing again with the same address updates them
+        dbc.Checklist(id="email-countries", options=[{"label": v, "value": k} for k, v in countries().items()],
+                      value=list(countries()), inline=True, className="mt-2"),
+        dbc.Checklist(id="email-sections", options=[{"label": v, "value": k} for k, v in DIGEST_SECTIONS.items()],
+                      value=list(DIGEST_SECTIONS), inline=True),
         html.Div(id="email-status", className="text-success mt-2"),
         html.Small("说明：邮箱列表仅保存在服务器缓存中；发送方需配置 SENDGRID 或 SMTP 环境变量。", className="text-muted")
     ]),
@@ -120,64 +204,208 @@ email_form = dbc.Card(
     Output("email-status", "children"),
     Input("email-submit", "n_clicks"),
     State("email-input", "value"),
+    State("email-countries", "value"),
+    State("email-sections", "value"),
     prevent_initial_call=True
 )
-def subscribe_email(n, value):
+def subscribe_email(n, value, country_keys, section_keys):
     if not value:
         return "请输入有效邮箱地址。"
-    ok, msg = add_email_recipient(value)
-    if ok:
-        return f"订阅成功：{value}。当前订阅数：{len(list_email_recipients())}"
-    else:
+    if not country_keys or not section_keys:
+        return "请至少选择一个国家/地区和一个栏目。"
+    ok, msg = add_email_recipient(value, country_keys, section_keys)
+    if not ok:
         return f"订阅失败：{msg}"
+    if msg == "已更新":
+        return f"已更新订阅内容：{value}"
+    return f"订阅成功：{value}。当前订阅数：{count_email_recipients()}"
 
 # Layout
-app.layout = dbc.Container(
-    [
-        dbc.Row([dbc.Col(html.H2(APP_TITLE), md=8, xs=12),
-                 dbc.Col(html.Div(APP_SUB, className="text-muted"), md=4, xs=12)],
-                 className="mt-3 mb-2"),
-        html.H4("首页概览"),
-        dbc.Row([macro_row("CN","中国"), macro_row("US","美国"), macro_row("EU","欧盟")], className="gy-3"),
-        html.Hr(),
-        html.H4("主要债券"),
-        dbc.Row([bonds_row("CN","中国"), bonds_row("US","美国"), bonds_row("EU","欧盟")], className="gy-3"),
-        html.Hr(),
-        html.H4("主要股指"),
-        dbc.Row([stocks_row("CN","中国"), stocks_row("US","美国"), stocks_row("EU","欧盟")], className="gy-3"),
-        html.Hr(),
-        html.H4("趋势图"),
-        cpi_chart(),
-        html.Hr(),
-        html.H4("重点新闻（自动翻译非中文来源）"),
-        dbc.ListGroup([
-            dbc.ListGroupItem(
-                html.Div([
-                    html.H6(item.get("title","无标题")),
-                    html.Small(item.get("source",""), className="text-muted me-2"),
-                    html.Small(item.get("pub_time",""), className="text-muted"),
-                    html.P(item.get("summary",""), className="mt-2 mb-1"),
-                    html.A("原文链接", href=item.get("link","#"), target="_blank")
-                ])
-            ) for item in (news_items or [])[:15]
-        ]),
-        html.Hr(),
-        email_form,
-        html.Div(className="mb-4")
-    ],
-    fluid=True
-)
+def build_layout(macro, stocks, bonds, news_items, hist, live_version=None):
+    return dbc.Container(
+        [
+            dbc.Row([dbc.Col(html.H2(APP_TITLE), md=8, xs=12),
+                     dbc.Col([html.Div(APP_SUB, className="text-muted"), live_controls(live_version)], md=4, xs=12)],
+                     className="mt-3 mb-2"),
+            html.H4("首页概览"),
+            dbc.Row([macro_row(macro,"CN","中国"), macro_row(macro,"US","美国"), macro_row(macro,"EU","欧盟")], className="gy-3"),
+            html.Hr(),
+            html.H4("主要债券"),
+            dbc.Row([bonds_row(bonds,"CN","中国"), bonds_row(bonds,"US","美国"), bonds_row(bonds,"EU","欧盟")], className="gy-3"),
+            html.Hr(),
+            *market_sections(stocks),
+            html.H4("趋势图"),
+            trend_section(),
+            cpi_chart(hist),
+            html.Hr(),
+            html.H4("重点新闻（自动翻译非中文来源）"),
+            dbc.ListGroup([
+                dbc.ListGroupItem(
+                    html.Div([
+                        html.H6(item.get("title","无标题")),
+                        html.Small(item.get("source",""), className="text-muted me-2"),
+                        html.Small(item.get("pub_time",""), className="text-muted"),
+                        html.Small(f"另见：{'、'.join(item['also'])}", className="text-muted ms-2") if item.get("also") else None,
+                        html.P(item.get("summary",""), className="mt-2 mb-1"),
+                        html.A("原文链接", href=item.get("link","#"), target="_blank")
+                    ])
+                ) for item in (news_items or [])[:15]
+            ]),
+            html.Hr(),
+            email_form,
+            html.Div(className="mb-4")
+        ],
+        fluid=True
+    )
+
+# Rendered once per data generation (cache file versions); page views reuse
+# the memoized tree until a refresh writes new files.
+_render_cache = {"generation": None, "layout": None}
+_render_lock = threading.Lock()
+
+def serve_layout():
+    gen = cache_generation()
+    with _render_lock:
+        if _render_cache["generation"] != gen:
+            ver = snapshot_version()  # read before the data, so the page never claims newer values than it shows
+            _render_cache["layout"] = build_layout(*load_all(), live_version=ver)
+            _render_cache["generation"] = gen
+        return _render_cache["layout"]
+
+app.layout = serve_layout
 
 # ---- Flask routes for cron ----
+# Refresh + email run as a background job; /cron only enqueues it so the
+# request returns well inside gunicorn's worker timeout.
+def _cron_steps():
+    def refresh(report):
+        return refresh_all_data(force_if_stale_minutes=0,
+                                progress=lambda done, total: report({"sources_done": done, "sources_total": total}))
+    def email(report):
+        return {"sent": send_daily_email_summary()}
+    return [("refresh", refresh), ("email", email)]
+
+register_job_kind("cron", _cron_steps)
+
+def _warmup_steps():
+    # Skipped if the cache is recent, e.g. right after a queued /cron run
+    return [("refresh", lambda report: refresh_all_data(force_if_stale_minutes=180))]
+
+register_job_kind("warmup", _warmup_steps)
+
 @server.route("/cron")
 def cron():
+    job_id = submit_job("cron")
+    return jsonify({"job_id": job_id, "status_url": f"/cron/status/{job_id}"}), 202
+
+@server.route("/cron/status/<job_id>")
+def cron_status(job_id):
+    job = get_job(job_id)
+    if job is None:
+        return jsonify({"error": "unknown job"}), 404
+    return jsonify(job), 200
+
+# ---- Live mode ----
+# Opt-in polling: the page remembers the snapshot version it was rendered
+# from and asks /api/live?since=<version> for the card values that changed;
+# the clientside callback writes them straight into the value spans. An
+# unchanged poll is a ~30 byte response, and nothing is re-rendered.
+LIVE_POLL_SECONDS = int(os.getenv("LIVE_POLL_SECONDS", "30"))
+LIVE_HISTORY = 16  # versions kept per process to diff against; older clients get the full set
+
+_live_history: "OrderedDict[int, dict]" = OrderedDict()
+_live_lock = threading.Lock()
+
+def live_controls(version):
+    return html.Div([
+        dbc.Switch(id="live-toggle", label="实时更新", value=False, className="mt-1"),
+        dcc.Interval(id="live-interval", interval=LIVE_POLL_SECONDS * 1000, disabled=True),
+        dcc.Store(id="live-version", data=version),
+    ])
+
+app.clientside_callback("function(on) { return !on; }",
+                        Output("live-interval", "disabled"), Input("live-toggle", "value"))
+
+app.clientside_callback(
+    """
+    function(n, version) {
+        if (window._liveVersion === undefined) { window._liveVersion = version; }
+        fetch("/api/live?since=" + (window._liveVersion ?? ""), {cache: "no-store"})
+            .then(function(r) { return r.json(); })
+            .then(function(d) {
+                Object.entries(d.changed || {}).forEach(function([id, text]) {
+                    var el = document.getElementById(id);
+                    if (el) { el.textContent = text; }
+                });
+                window._liveVersion = d.v;
+            })
+            .catch(function() {});
+        return window.dash_clientside.no_update;
+    }
+    """,
+    Output("live-version", "data"),
+    Input("live-interval", "n_intervals"),
+    State("live-version", "data"),
+    prevent_initial_call=True,
+)
+
+def _live_snapshot():
+    # (version, values); retried if a refresh lands while reading so values always match the version
+    for _ in range(3):
+        ver = snapshot_version()
+        with _live_lock:
+            if ver in _live_history:
+                return ver, _live_history[ver]
+        vals = live_values(load_cached_macro_snapshot(), load_cached_bonds_snapshot(), load_cached_stocks_snapshot())
+        if snapshot_version() == ver:
+            with _live_lock:
+                _live_history[ver] = vals
+                while len(_live_history) > LIVE_HISTORY:
+                    _live_history.popitem(last=False)
+            return ver, vals
+    return snapshot_version(), vals
+
+@server.route("/api/live")
+def live_delta():
+    ver, vals = _live_snapshot()
     try:
-        refresh_all_data(force_if_stale_minutes=0)
-        # After refresh, send email to subscribers
-        sent = send_daily_email_summary()
-        return f"Refreshed and email sent to {sent} recipients at {datetime.utcnow().isoformat()}Z\n", 200
+        since = int(request.args.get("since", ""))
+    except ValueError:
+        since = None
+    with _live_lock:
+        old = _live_history.get(since)
+    if since == ver:
+        changed = {}
+    elif old is not None:
+        changed = {k: v for k, v in vals.items() if old.get(k) != v}
+    else:
+        changed = vals
+    resp = jsonify({"v": ver, "changed": changed})
+    resp.headers["Cache-Control"] = "no-store"
+    return resp
+
+# ---- Prometheus metrics ----
+@server.route("/metrics")
+def metrics_endpoint():
+    return Response(render_prometheus(), mimetype="text/plain; version=0.0.4")
+
+# ---- Startup ----
+def _warmup():
+    # Off the request path: load the deferred modules, then render the cached page once
+    try:
+        t0 = time.perf_counter()
+        warm(WARM_IMPORTS)
+        serve_layout()
+        print(f"Warmup done in {time.perf_counter() - t0:.2f}s; deferred imports: {load_times()}", file=sys.stderr)
     except Exception as e:
-        return f"Error: {e}\n", 500
+        print("Warmup failed:", e)
+
+if STARTUP_MODE == "eager":
+    warm(WARM_IMPORTS)
+start_leader_election(on_elected_leader)
+print(f"app imported in {time.perf_counter() - _t0:.2f}s (STARTUP_MODE={STARTUP_MODE})", file=sys.stderr)
+if STARTUP_MODE != "eager":
+    threading.Thread(target=_warmup, name="warmup", daemon=True).start()
 
 if __name__ == "__main__":
     app.run_server(host="0.0.0.0", port=int(os.getenv("PORT", "8050")), debug=True)
@@ -0,0 +1,151 @@
+# Import-time profile of `import app`: runs it in fresh interpreters under
+# `python -X importtime` and reports wall time, per-module self/cumulative
+# times and per-package totals, plus which heavy libraries were loaded before
+# the worker could serve. Upstreams point at a closed local port and the cache
+# is a throwaway dir, so nothing leaves the machine. Compare with a previous run:
+#
+#   python bench/import_profile.py --out bench/import_profile.json
+#   python bench/import_profile.py --baseline bench/import_profile.json --tolerance 0.2
+#   python bench/import_profile.py --mode eager   # old behaviour: everything + refresh at import
+
+import os
+import sys
+import json
+import shutil
+import argparse
+import platform
+import statistics
+import subprocess
+import tempfile
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Dict, Any, List, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY = ["pandas", "numpy", "pyarrow", "plotly.express", "feedparser", "apscheduler"]
+DEAD = "http://127.0.0.1:9"  # discard port: connections are refused at once
+
+# Runs in the child. The background warmup threads are not started: they are
+# off the request path by design, and their imports would interleave with
+# (and skew) the main thread's -X importtime tree.
+PROBE = f"""
+import sys, time, json, threading
+_start = threading.Thread.start
+threading.Thread.start = lambda t: None if t.name in ("warmup", "leader-warmup") else _start(t)
+t0 = time.perf_counter()
+import app
+wall = time.perf_counter() - t0
+print("@@" + json.dumps({{"wall": wall, "heavy": [m for m in {HEAVY!r} if m in sys.modules]}}))
+"""
+
+def _env(cache_dir: str, mode: str) -> Dict[str, str]:
+    env = dict(os.environ)
+    env.update({
+        "MACRO_CACHE_DIR": cache_dir,
+        "STARTUP_MODE": mode,
+        "WB_BASE_URL": DEAD, "YAHOO_BASE_URL": DEAD, "TE_BASE_URL": DEAD,
+        "DEEPL_API_URL": DEAD, "RSS_BASE_URL": DEAD,
+        "LEADER_RETRY_SECONDS": "3600",
+        "PYTHONDONTWRITEBYTECODE": "1",
+    })
+    return env
+
+def parse_importtime(stderr: str) -> Dict[str, Tuple[int, int]]:
+    # "import time: <self us> | <cumulative us> | <indented module name>" -> {name: (self_us, cum_us)}
+    out = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        parts = line[len("import time:"):].split("|")
+        if len(parts) != 3 or not parts[0].strip().isdigit():
+            continue  # header line
+        out[parts[2].strip()] = (int(parts[0]), int(parts[1]))
+    return out
+
+def _run_once(mode: str) -> Dict[str, Any]:
+    cache_dir = tempfile.mkdtemp(prefix="macro-import-")
+    try:
+        hist = os.path.join(ROOT, "cache", "macro_history.csv")
+        if os.path.exists(hist):
+            shutil.copy(hist, cache_dir)
+        p = subprocess.run([sys.executable, "-X", "importtime", "-c", PROBE], cwd=ROOT, env=_env(cache_dir, mode),
+                           capture_output=True, text=True, timeout=300)
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+    marker = [l for l in p.stdout.splitlines() if l.startswith("@@")]
+    if p.returncode != 0 or not marker:
+        raise RuntimeError(f"import app failed (exit {p.returncode}):\n{p.stderr[-2000:]}")
+    return {**json.loads(marker[-1][2:]), "modules": parse_importtime(p.stderr)}
+
+def profile(mode: str, repeat: int, top: int) -> Dict[str, Any]:
+    runs = [_run_once(mode) for _ in range(repeat)]
+    ms = lambda us: round(us / 1000, 2)
+    names = set().union(*(r["modules"] for r in runs))
+    med = {n: (statistics.median(r["modules"].get(n, (0, 0))[0] for r in runs),
+               statistics.median(r["modules"].get(n, (0, 0))[1] for r in runs)) for n in names}
+    packages = defaultdict(float)
+    for n, (self_us, _) in med.items():
+        packages[n.split(".")[0]] += self_us
+    heaviest = sorted(med.items(), key=lambda kv: -kv[1][1])[:top]
+    return {
+        "wall_ms": round(statistics.median(r["wall"] for r in runs) * 1000, 2),
+        "wall_runs_ms": [round(r["wall"] * 1000, 2) for r in runs],
+        "modules_imported": len(names),
+        "heavy_loaded": sorted(set().union(*(r["heavy"] for r in runs))),
+        "packages_ms": {k: ms(v) for k, v in sorted(packages.items(), key=lambda kv: -kv[1])[:top]},
+        "modules_ms": {n: {"self": ms(s), "cumulative": ms(c)} for n, (s, c) in heaviest},
+    }
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    # Slower wall time or package totals, and heavy libraries that are now loaded at import
+    regressions = []
+    cur, base = current["results"], baseline.get("results", {})
+    if base.get("wall_ms"):
+        ratio = cur["wall_ms"] / base["wall_ms"]
+        cur["vs_baseline"] = round(ratio, 3)
+        if ratio > 1 + tolerance:
+            regressions.append(f"import app: {base['wall_ms']:.0f}ms -> {cur['wall_ms']:.0f}ms (x{ratio:.2f})")
+    for pkg, v in cur["packages_ms"].items():
+        b = base.get("packages_ms", {}).get(pkg)
+        if b and v > b * (1 + tolerance) and v - b > 20:  # ignore jitter on tiny packages
+            regressions.append(f"package {pkg}: {b:.0f}ms -> {v:.0f}ms")
+    for m in sorted(set(cur["heavy_loaded"]) - set(base.get("heavy_loaded", cur["heavy_loaded"]))):
+        regressions.append(f"{m} is now imported at startup")
+    return regressions
+
+def main():
+    ap = argparse.ArgumentParser(description="Per-module import-time profile of `import app`")
+    ap.add_argument("--mode", default="lazy", choices=["lazy", "eager"], help="STARTUP_MODE for the child process")
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--top", type=int, default=25, help="modules/packages listed in the report")
+    ap.add_argument("--out", help="write results JSON here")
+    ap.add_argument("--baseline", help="previous results JSON to compare against")
+    ap.add_argument("--tolerance", type=float, default=0.2, help="allowed slowdown vs baseline (0.2 = 20%%)")
+    args = ap.parse_args()
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "mode": args.mode,
+            "repeat": args.repeat,
+        },
+        "results": profile(args.mode, args.repeat, args.top),
+    }
+    regressions = []
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        report["regressions"] = regressions
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    print(text)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    if regressions:
+        print("\n".join(["Startup regressions:"] + regressions), file=sys.stderr)
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+# Multi-process check of leader election (modules/leader.py): starts N worker
+# processes sharing one cache dir, asserts exactly one becomes leader, kills
+# it with SIGKILL (no cleanup, like an OOM kill), and asserts exactly one
+# follower takes over within the retry interval. Repeats for --rounds kills.
+#
+#   python bench/leader_harness.py --workers 4 --rounds 2
+
+import os
+import sys
+import time
+import signal
+import shutil
+import argparse
+import subprocess
+import tempfile
+from typing import Dict, List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def child(events_dir: str):
+    # Runs in each worker: record the moment this process is elected, then idle
+    sys.path.insert(0, ROOT)
+    from modules.leader import start_leader_election
+
+    def elected():
+        with open(os.path.join(events_dir, f"{time.time():.6f}-{os.getpid()}"), "w") as f:
+            f.write(str(os.getpid()))
+
+    start_leader_election(elected)
+    while True:
+        time.sleep(3600)
+
+def _elections(events_dir: str) -> List[int]:
+    # Elected pids in election order
+    return [int(n.rsplit("-", 1)[1]) for n in sorted(os.listdir(events_dir))]
+
+def _wait_for(events_dir: str, count: int, timeout: float) -> List[int]:
+    end = time.monotonic() + timeout
+    while time.monotonic() < end:
+        found = _elections(events_dir)
+        if len(found) >= count:
+            return found
+        time.sleep(0.05)
+    return _elections(events_dir)
+
+def run(workers: int, rounds: int, retry: int) -> List[str]:
+    cache_dir = tempfile.mkdtemp(prefix="macro-leader-")
+    events_dir = os.path.join(cache_dir, "elections")
+    os.makedirs(events_dir)
+    env = dict(os.environ, MACRO_CACHE_DIR=cache_dir, LEADER_RETRY_SECONDS=str(retry))
+    procs: Dict[int, subprocess.Popen] = {}
+    failures = []
+    try:
+        for _ in range(workers):
+            p = subprocess.Popen([sys.executable, os.path.abspath(__file__), "--child", events_dir], cwd=ROOT, env=env)
+            procs[p.pid] = p
+        for rnd in range(rounds + 1):
+            found = _wait_for(events_dir, rnd + 1, timeout=retry * 3 + 10)
+            time.sleep(retry * 2)  # settle: any second leader would show up within a retry interval
+            found = _elections(events_dir)
+            if len(found) != rnd + 1:
+                failures.append(f"round {rnd}: expected {rnd + 1} elections in total, saw {len(found)} ({found})")
+                break
+            leader = found[-1]
+            if leader not in procs or procs[leader].poll() is not None:
+                failures.append(f"round {rnd}: elected pid {leader} is not a live worker")
+                break
+            print(f"round {rnd}: leader pid {leader} ({len(procs)} workers alive)")
+            if rnd == rounds or len(procs) < 2:
+                break
+            t0 = time.monotonic()
+            procs.pop(leader).send_signal(signal.SIGKILL)
+            found = _wait_for(events_dir, rnd + 2, timeout=retry * 3 + 10)
+            if len(found) < rnd + 2:
+                failures.append(f"round {rnd}: no follower took over within {retry * 3 + 10:.0f}s of killing {leader}")
+                break
+            print(f"round {rnd}: pid {found[-1]} took over {time.monotonic() - t0:.2f}s after the kill")
+    finally:
+        for p in procs.values():
+            p.kill()
+        for p in procs.values():
+            p.wait()
+        shutil.rmtree(cache_dir, ignore_errors=True)
+    return failures
+
+def main():
+    if len(sys.argv) == 3 and sys.argv[1] == "--child":
+        child(sys.argv[2])
+        return
+    ap = argparse.ArgumentParser(description="Multi-process leader election / failover check")
+    ap.add_argument("--workers", type=int, default=4)
+    ap.add_argument("--rounds", type=int, default=2, help="how many times the leader is killed")
+    ap.add_argument("--retry", type=int, default=1, help="LEADER_RETRY_SECONDS for the workers")
+    args = ap.parse_args()
+    if args.workers < 2:
+        ap.error("--workers must be at least 2")
+    failures = run(args.workers, min(args.rounds, args.workers - 1), args.retry)
+    if failures:
+        print("\n".join(["Leader election check failed:"] + failures), file=sys.stderr)
+        sys.exit(1)
+    print("ok: exactly one leader at a time, failover worked")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,229 @@
+
+# Local stand-in for every upstream (World Bank, Yahoo, TradingEconomics,
+# DeepL, RSS, SendGrid) replaying the fixtures in bench/fixtures, plus a
+# minimal SMTP sink. Latency and failures can be injected per upstream.
+#
+#   python bench/replay_server.py --port 9000 --latency wb=150,yahoo=80 --fail te=0.2
+
+import os
+import json
+import time
+import random
+import argparse
+import threading
+import socketserver
+from email.utils import formatdate
+from xml.sax.saxutils import escape
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs, unquote
+from typing import Dict, Optional
+
+FIXTURES = os.path.join(os.path.dirname(__file__), "fixtures")
+UPSTREAMS = ("wb", "yahoo", "te", "deepl", "rss", "sendgrid")
+
+def _fixture(name: str) -> str:
+    with open(os.path.join(FIXTURES, name), "r", encoding="utf-8") as f:
+        return f.read()
+
+def _walk(symbol: str, days: int = 63) -> Dict:
+    # Deterministic daily random walk per symbol, shaped like one chart result
+    rng = random.Random(symbol)
+    start = int(time.time()) // 86400 * 86400 - days * 86400
+    level, closes = 100 + rng.random() * 5000, []
+    for _ in range(days):
+        level *= 1 + rng.gauss(0, 0.01)
+        closes.append(round(level, 4))
+    return {"meta": {"symbol": symbol}, "timestamp": [start + d * 86400 for d in range(days)],
+            "indicators": {"quote": [{"close": closes}]}}
+
+class ReplayConfig:
+    def __init__(self, latency_ms: Optional[Dict[str, float]] = None, jitter_ms: float = 0.0,
+                 fail_rate: Optional[Dict[str, float]] = None, seed: int = 0):
+        self.latency_ms = latency_ms or {}
+        self.jitter_ms = jitter_ms
+        self.fail_rate = fail_rate or {}
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.hits = {u: 0 for u in UPSTREAMS}
+
+    def delay(self, upstream: str) -> float:
+        with self.lock:
+            jitter = self.rng.uniform(0, self.jitter_ms) if self.jitter_ms else 0.0
+        return (self.latency_ms.get(upstream, 0.0) + jitter) / 1000.0
+
+    def should_fail(self, upstream: str) -> bool:
+        rate = self.fail_rate.get(upstream, 0.0)
+        with self.lock:
+            return rate > 0 and self.rng.random() < rate
+
+class ReplayHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    config: ReplayConfig = ReplayConfig()
+    wb = json.loads(_fixture("worldbank.json"))
+    rss_etag = '"replay-1"'
+    rss_local = json.loads(_fixture("rss_local.json"))
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, code: int, body: bytes = b"", ctype: str = "application/json", headers: Optional[Dict[str, str]] = None):
+        self.send_response(code)
+        self.send_header("Content-Type", ctype)
+        self.send_header("Content-Length", str(len(body)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _json(self, obj, code: int = 200):
+        self._send(code, json.dumps(obj).encode("utf-8"))
+
+    def _route(self, method: str):
+        parts = urlsplit(self.path)
+        upstream, _, rest = parts.path.lstrip("/").partition("/")
+        if upstream not in UPSTREAMS:
+            return self._send(404)
+        with self.config.lock:
+            self.config.hits[upstream] += 1
+        time.sleep(self.config.delay(upstream))
+        if self.config.should_fail(upstream):
+            return self._json({"error": "injected failure"}, 503)
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else b""
+        getattr(self, f"_{upstream}")(rest, parse_qs(parts.query), body)
+
+    def do_GET(self):
+        self._route("GET")
+
+    def do_POST(self):
+        self._route("POST")
+
+    # /wb/country/CHN;USA;EUU/indicator/<id>?date=a:b&page=&per_page=
+    def _wb(self, rest: str, q, body: bytes):
+        segs = rest.split("/")
+        countries, indicator = unquote(segs[1]).split(";"), segs[3]
+        start, _, end = q.get("date", ["1960:2100"])[0].partition(":")
+        rows = [{"indicator": {"id": indicator}, "country": {"id": c[:2]}, "countryiso3code": c, "date": y, "value": v}
+                for c in countries for y, v in sorted(self.wb.get(indicator, {}).get(c, {}).items(), reverse=True)
+                if int(start) <= int(y) <= int(end or start)]
+        per_page = int(q.get("per_page", ["50"])[0]); page = int(q.get("page", ["1"])[0])
+        pages = max(1, -(-len(rows) // per_page))
+        self._json([{"page": page, "pages": pages, "per_page": per_page, "total": len(rows)},
+                    rows[(page - 1) * per_page: page * per_page]])
+
+    # /yahoo/v8/finance/chart/<symbol>, /yahoo/v7/finance/spark?symbols=a,b
+    def _yahoo(self, rest: str, q, body: bytes):
+        if rest.endswith("spark"):
+            symbols = q.get("symbols", [""])[0].split(",")
+            return self._json({"spark": {"result": [{"symbol": s, "response": [_walk(s)]} for s in symbols], "error": None}})
+        symbol = unquote(rest.rsplit("/", 1)[-1])
+        self._send(200, _fixture("yahoo_chart.json").replace("{symbol}", symbol).encode("utf-8"))
+
+    # /te/bonds/major, /te/country/<a,b,c>, other /te/... paths return a single indicator
+    def _te(self, rest: str, q, body: bytes):
+        if rest.startswith("bonds"):
+            return self._send(200, _fixture("te_bonds_major.json").encode("utf-8"))
+        if rest.startswith("country/"):
+            template = json.loads(_fixture("te_country.json"))
+            names = unquote(rest.split("/", 1)[1]).split(",")
+            return self._json([{**row, "Country": n.title()} for n in names for row in template])
+        country = (q.get("country") or [rest.rsplit("/", 1)[-1]])[0]
+        self._send(200, _fixture("te_indicator.json").replace("{country}", country).encode("utf-8"))
+
+    # POST /deepl  (form: text=...&text=...)
+    def _deepl(self, rest: str, q, body: bytes):
+        texts = parse_qs(body.decode("utf-8")).get("text", [])
+        self._json({"translations": [{"detected_source_language": "EN", "text": f"[ZH] {t}"} for t in texts]})
+
+    # /rss/<source>, honours If-None-Match. Every feed carries the same syndicated
+    # stories (rss.xml) plus a few picked per source from rss_local.json, so some
+    # items are duplicates across feeds and some are unique (and get translated).
+    def _rss(self, rest: str, q, body: bytes):
+        if self.headers.get("If-None-Match") == self.rss_etag:
+            return self._send(304, headers={"ETag": self.rss_etag})
+        source, pubdate = unquote(rest), formatdate(usegmt=True)
+        local = "".join(
+            f"<item><title>{escape(s['title'])}</title><link>https://example.com/{source}/local-{i}</link>"
+            f"<guid>{source}-local-{i}</guid><pubDate>{pubdate}</pubDate><description>{escape(s['description'])}</description></item>\n"
+            for i, s in enumerate(random.Random(source).sample(self.rss_local, 3)))
+        xml = _fixture("rss.xml").replace("{local}", local.rstrip("\n")).replace("{source}", source).replace("{pubdate}", pubdate)
+        self._send(200, xml.encode("utf-8"), "application/rss+xml", {"ETag": self.rss_etag})
+
+    # POST /sendgrid/v3/mail/send
+    def _sendgrid(self, rest: str, q, body: bytes):
+        self._send(202, b"")
+
+def start_replay_server(config: ReplayConfig, port: int = 0) -> ThreadingHTTPServer:
+    handler = type("Handler", (ReplayHandler,), {"config": config})
+    srv = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    srv.daemon_threads = True
+    threading.Thread(target=srv.serve_forever, name="replay-http", daemon=True).start()
+    return srv
+
+# ---------------- SMTP sink ----------------
+class _SMTPHandler(socketserver.StreamRequestHandler):
+    def _reply(self, line: str):
+        self.wfile.write((line + "\r\n").encode("ascii"))
+
+    def handle(self):
+        self._reply("220 replay ESMTP")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            cmd = line.decode("utf-8", "replace").strip().upper()
+            if cmd.startswith(("EHLO", "HELO")):
+                self._reply("250 replay")
+            elif cmd.startswith("DATA"):
+                self._reply("354 end with .")
+                while self.rfile.readline() not in (b".\r\n", b".\n", b""):
+                    pass
+                with self.server.lock:
+                    self.server.messages += 1
+                self._reply("250 OK queued")
+            elif cmd.startswith("QUIT"):
+                self._reply("221 bye")
+                return
+            else:  # MAIL, RCPT, RSET, NOOP
+                self._reply("250 OK")
+
+class SMTPSink(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, port: int = 0):
+        super().__init__(("127.0.0.1", port), _SMTPHandler)
+        self.lock = threading.Lock()
+        self.messages = 0
+
+def start_smtp_sink(port: int = 0) -> SMTPSink:
+    sink = SMTPSink(port)
+    threading.Thread(target=sink.serve_forever, name="replay-smtp", daemon=True).start()
+    return sink
+
+def parse_rates(spec: str) -> Dict[str, float]:
+    # "wb=150,yahoo=80" -> {"wb": 150.0, "yahoo": 80.0}
+    out = {}
+    for part in filter(None, (spec or "").split(",")):
+        k, _, v = part.partition("=")
+        out[k.strip()] = float(v)
+    return out
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Replay server for all dashboard upstreams")
+    ap.add_argument("--port", type=int, default=9000)
+    ap.add_argument("--smtp-port", type=int, default=9025)
+    ap.add_argument("--latency", default="", help="per-upstream latency in ms, e.g. wb=150,yahoo=80")
+    ap.add_argument("--jitter", type=float, default=0.0, help="uniform extra latency in ms")
+    ap.add_argument("--fail", default="", help="per-upstream failure rate, e.g. te=0.2")
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+    cfg = ReplayConfig(parse_rates(args.latency), args.jitter, parse_rates(args.fail), args.seed)
+    start_replay_server(cfg, args.port)
+    start_smtp_sink(args.smtp_port)
+    print(f"replay http://127.0.0.1:{args.port}  smtp 127.0.0.1:{args.smtp_port}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
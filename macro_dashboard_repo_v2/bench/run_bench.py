@@ -0,0 +1,193 @@
+
+# Offline benchmark: runs refresh, news, layout build and the email digest
+# against bench/replay_server.py (HTTP upstreams + SMTP sink) in a throwaway
+# cache dir, and prints/saves JSON timings. Compare with a previous run:
+#
+#   python bench/run_bench.py --out bench/results.json
+#   python bench/run_bench.py --baseline bench/results.json --tolerance 0.2
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import statistics
+import subprocess
+import tempfile
+from datetime import datetime, timezone
+from typing import Callable, Dict, Any, List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from replay_server import ReplayConfig, UPSTREAMS, start_replay_server, start_smtp_sink, parse_rates  # noqa: E402
+
+def _configure_env(ports: Dict[str, int], smtp_port: int, cache_dir: str, sendgrid: bool):
+    # Must run before any modules.* import: base URLs and CACHE_DIR are read at import time.
+    # Each upstream gets its own port so per-host state (connection pools,
+    # circuit breakers) behaves as it does against the real, distinct hosts.
+    base = {u: f"http://127.0.0.1:{p}/{u}" for u, p in ports.items()}
+    os.environ.update({
+        "MACRO_CACHE_DIR": cache_dir,
+        "WB_BASE_URL": base["wb"],
+        "YAHOO_BASE_URL": base["yahoo"],
+        "TE_BASE_URL": base["te"],
+        "DEEPL_API_URL": base["deepl"],
+        "RSS_BASE_URL": base["rss"],
+        "TE_API_CLIENT_KEY": "bench",
+        "TE_API_CLIENT_SECRET": "bench",
+        "DEEPL_API_KEY": "bench",
+        "SMTP_HOST": "127.0.0.1",
+        "SMTP_PORT": str(smtp_port),
+        "SMTP_STARTTLS": "0",
+        "EMAIL_SENDER": "bench@example.com",
+        "LEADER_RETRY_SECONDS": "3600",
+        "STARTUP_MODE": "eager",  # warmup in the foreground, so no background thread overlaps the timings
+    })
+    for k in ("SMTP_USER", "SMTP_PASS", "SENDGRID_API_KEY"):
+        os.environ.pop(k, None)
+    if sendgrid:
+        os.environ["SENDGRID_API_KEY"] = "bench"
+        os.environ["SENDGRID_API_HOST"] = base["sendgrid"]
+
+def _summary(samples: List[float]) -> Dict[str, float]:
+    ms = sorted(s * 1000 for s in samples)
+    p95 = ms[min(len(ms) - 1, int(round(0.95 * (len(ms) - 1))))]
+    return {"n": len(ms), "min_ms": round(ms[0], 3), "median_ms": round(statistics.median(ms), 3),
+            "p95_ms": round(p95, 3), "max_ms": round(ms[-1], 3), "mean_ms": round(statistics.fmean(ms), 3)}
+
+def _time(fn: Callable[[int], Any], repeat: int, setup: Callable[[], None] = None) -> Dict[str, float]:
+    samples = []
+    for i in range(repeat):
+        if setup:
+            setup()
+        t0 = time.perf_counter()
+        fn(i)
+        samples.append(time.perf_counter() - t0)
+    return _summary(samples)
+
+def _git_rev() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, timeout=10).stdout.strip()
+    except Exception:
+        return ""
+
+def run(args) -> Dict[str, Any]:
+    cfg = ReplayConfig(parse_rates(args.latency), args.jitter, parse_rates(args.fail), args.seed)
+    ports = {u: start_replay_server(cfg).server_address[1] for u in UPSTREAMS}
+    sink = start_smtp_sink()
+    cache_dir = tempfile.mkdtemp(prefix="macro-bench-")
+    _configure_env(ports, sink.server_address[1], cache_dir, args.sendgrid)
+
+    from modules import data_fetch as df
+    from modules.cache_store import store
+    from modules.subscribers import import_subscribers, add_subscriber, segment_counts
+    from modules.digest import SECTIONS
+    from modules.instruments import countries
+
+    def clear_group_files():
+        # Cold refresh: drop every cached snapshot (panel, news store, translations stay unless --cold-all)
+        names = list(df.DATA_FILES) + ([df.WB_PANEL, "news_store.json", "translations.sqlite3"] if args.cold_all else [])
+        for n in names:
+            try:
+                os.remove(store.path(n))
+            except OSError:
+                pass
+
+    results: Dict[str, Any] = {}
+    results["refresh_cold"] = _time(lambda i: df.refresh_all_data(force_if_stale_minutes=0), args.repeat, clear_group_files)
+    results["refresh_warm"] = _time(lambda i: df.refresh_all_data(force_if_stale_minutes=0), args.repeat)
+    results["fetch_news_items"] = _time(lambda i: df.fetch_news_items(), args.repeat)
+
+    import app  # leader election + warmup refresh happen here; the cache is fresh so the warmup is a no-op
+    results["build_layout"] = _time(lambda i: app.build_layout(*app.load_all()), args.repeat)
+    app.serve_layout()  # prime the memo; the timed calls measure the cache-hit path
+    results["serve_layout_memoized"] = _time(lambda i: app.serve_layout(), args.repeat)
+
+    rng = random.Random(args.seed)
+    addrs = [f"bench{rng.getrandbits(40):x}.{n}@example.com" for n in range(args.subscribers)]
+    import_subscribers(addrs)
+    # Spread subscribers over up to --segments preference combinations (the first one is the full digest)
+    combos = [((), ())] + [(tuple(rng.sample(list(countries()), rng.randint(1, len(countries())))),
+                            tuple(rng.sample(list(SECTIONS), rng.randint(1, len(SECTIONS)))))
+                           for _ in range(max(args.segments - 1, 0))]
+    for n, a in enumerate(addrs):
+        add_subscriber(a, *combos[n % len(combos)])
+    before = sink.messages
+    results["send_daily_email_summary"] = _time(lambda i: df.send_daily_email_summary(run_id=f"bench-{i}"), args.repeat)
+    status = df.load_refresh_status()
+
+    return {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "git_rev": _git_rev(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "repeat": args.repeat,
+            "subscribers": args.subscribers,
+            "segments": args.segments,
+            "latency_ms": cfg.latency_ms,
+            "jitter_ms": cfg.jitter_ms,
+            "fail_rate": cfg.fail_rate,
+            "sendgrid": args.sendgrid,
+        },
+        "results": results,
+        "counters": {
+            "upstream_hits": dict(cfg.hits),
+            "smtp_messages": sink.messages - before,
+            "digest_segments": len(segment_counts()),
+            "last_refresh_missed": status.get("missed", []),
+            "cache": store.stats(),
+        },
+    }
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    # Medians that got slower than baseline * (1 + tolerance)
+    regressions = []
+    for name, cur in current["results"].items():
+        base = baseline.get("results", {}).get(name)
+        if not base or not base.get("median_ms"):
+            continue
+        ratio = cur["median_ms"] / base["median_ms"]
+        cur["vs_baseline"] = round(ratio, 3)
+        if ratio > 1 + tolerance:
+            regressions.append(f"{name}: median {base['median_ms']:.1f}ms -> {cur['median_ms']:.1f}ms (x{ratio:.2f})")
+    return regressions
+
+def main():
+    ap = argparse.ArgumentParser(description="Offline benchmark against the local replay server")
+    ap.add_argument("--repeat", type=int, default=5)
+    ap.add_argument("--subscribers", type=int, default=200)
+    ap.add_argument("--segments", type=int, default=1, help="distinct digest preference combinations among subscribers")
+    ap.add_argument("--latency", default="", help="per-upstream latency in ms, e.g. wb=150,yahoo=80,te=120")
+    ap.add_argument("--jitter", type=float, default=0.0)
+    ap.add_argument("--fail", default="", help="per-upstream failure rate, e.g. te=0.2")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--sendgrid", action="store_true", help="send through the SendGrid stand-in instead of SMTP")
+    ap.add_argument("--cold-all", action="store_true", help="cold refresh also drops the WB panel, news store and translations")
+    ap.add_argument("--out", help="write results JSON here")
+    ap.add_argument("--baseline", help="previous results JSON to compare medians against")
+    ap.add_argument("--tolerance", type=float, default=0.2, help="allowed median slowdown vs baseline (0.2 = 20%%)")
+    args = ap.parse_args()
+
+    report = run(args)
+    regressions = []
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        report["regressions"] = regressions
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    print(text)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    if regressions:
+        print("\n".join(["Performance regressions:"] + regressions), file=sys.stderr)
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+
+import os
+import json
+import threading
+from contextlib import contextmanager
+from typing import IO, Dict, Any, Optional, Tuple
+
+from modules.lazy import lazy_import
+
+pd = lazy_import("pandas")  # only the csv/parquet codecs need it
+
+try:
+    import fcntl
+except ImportError:  # Windows dev box: single process, no cross-process locking needed (and always the leader)
+    fcntl = None
+
+CACHE_DIR = os.getenv("MACRO_CACHE_DIR") or os.path.join(os.path.dirname(os.path.dirname(__file__)), "cache")
+os.makedirs(CACHE_DIR, exist_ok=True)
+
+@contextmanager
+def file_lock(name: str):
+    # Short cross-process critical section (blocking flock on cache/<name>.lock).
+    if fcntl is None:
+        yield
+        return
+    with open(os.path.join(CACHE_DIR, f"{name}.lock"), "a+") as fh:
+        fcntl.flock(fh, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(fh, fcntl.LOCK_UN)
+
+def try_file_lock(name: str) -> Optional[IO]:
+    # Non-blocking exclusive flock on cache/<name>.lock, held for as long as the
+    # returned handle stays open (the OS drops it when the process dies); None if
+    # another process holds it.
+    fh = open(os.path.join(CACHE_DIR, f"{name}.lock"), "a+")
+    if fcntl is None:
+        return fh
+    try:
+        fcntl.flock(fh, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        fh.close()
+        return None
+    return fh
+
+# ---------------- Atomic writes ----------------
+# Every cache file is written to a temp file unique to the writing process and
+# thread, then renamed over the target, so readers see either the old or the
+# new file, never a half-written one, and concurrent writers never share a temp.
+def _tmp_path(path: str) -> str:
+    return f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+
+def _dump_json(obj, path):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(obj, f, ensure_ascii=False, indent=2)
+
+def _load_json(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+# extension -> (load, dump)
+CODECS = {
+    ".json": (_load_json, _dump_json),
+    ".csv": (lambda path: pd.read_csv(path), lambda df, path: df.to_csv(path, index=False)),
+    ".parquet": (lambda path: pd.read_parquet(path), lambda df, path: df.to_parquet(path, index=False)),
+}
+
+def write_atomic(path: str, obj):
+    # obj serialized by the codec for path's extension
+    tmp = _tmp_path(path)
+    try:
+        CODECS[os.path.splitext(path)[1]][1](obj, tmp)
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+
+# ---------------- Versioned cache store ----------------
+# Writes are atomic (see above). Each write bumps a per-name version in
+# cache/store_versions.json (under a file lock, so it stays monotonic across
+# workers). Reads are served from memory and only go back to disk when that
+# version moves.
+VERSIONS_FILE = "store_versions.json"
+
+class CacheStore:
+    def __init__(self, root: str):
+        self.root = root
+        self._lock = threading.Lock()
+        self._mem: Dict[str, Tuple[Any, Any]] = {}  # name -> (version token, object)
+        self._versions: Dict[str, int] = {}
+        self._versions_sig = None
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.root, name)
+
+    def _codec(self, name: str):
+        return CODECS[os.path.splitext(name)[1]]
+
+    def _sig(self, path: str):
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        return st.st_ino, st.st_mtime_ns, st.st_size
+
+    def versions(self) -> Dict[str, int]:
+        p = self.path(VERSIONS_FILE)
+        sig = self._sig(p)
+        if sig != self._versions_sig:
+            try:
+                self._versions = _load_json(p) if sig else {}
+            except (OSError, ValueError):
+                self._versions = {}
+            self._versions_sig = sig
+        return self._versions
+
+    def version(self, name: str) -> int:
+        with self._lock:
+            return self.versions().get(name, 0)
+
+    def read(self, name: str, default=None):
+        # Returned objects are shared with other readers: treat them as read-only.
+        p = self.path(name)
+        with self._lock:
+            # Files not written through the store (e.g. seeded ones) carry
+            # version 0, so fall back to the file signature for those.
+            token = (self.versions().get(name, 0), self._sig(p))
+            cached = self._mem.get(name)
+            if cached is not None and cached[0] == token:
+                self.hits += 1
+                return cached[1]
+            self.misses += 1
+        if token[1] is None:
+            return default
+        try:
+            obj = self._codec(name)[0](p)
+        except (OSError, ValueError):
+            return default
+        with self._lock:
+            self._mem[name] = (token, obj)
+        return obj
+
+    def write(self, name: str, obj) -> int:
+        p = self.path(name)
+        tmp = _tmp_path(p)  # serialized outside the lock, renamed inside it so versions follow rename order
+        self._codec(name)[1](obj, tmp)
+        with file_lock("store"):
+            os.replace(tmp, p)
+            with self._lock:
+                versions = dict(self.versions())
+                versions[name] = versions.get(name, 0) + 1
+                write_atomic(self.path(VERSIONS_FILE), versions)
+                self.writes += 1
+                self._mem[name] = ((versions[name], self._sig(p)), obj)
+                return versions[name]
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "writes": self.writes}
+
+store = CacheStore(CACHE_DIR)
@@ -0,0 +1,88 @@
+
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+
+import numpy as np
+import pandas as pd
+
+# Figure helpers for the trend charts: figures are plain dicts (no plotly
+# express on the request path), cached per data generation, and long series
+# are downsampled server-side to roughly one point per pixel of chart width.
+MIN_POINTS = 200
+MAX_POINTS = 4000
+CACHE_ENTRIES = 64
+
+def minmax_downsample(y: np.ndarray, n_out: int) -> np.ndarray:
+    # Indices of at most ~n_out points: the min and the max of each of n_out/2
+    # equal-count buckets (plus first/last), in order. Unlike plain striding,
+    # every spike survives, so the downsampled line has the same envelope.
+    idx = np.flatnonzero(~np.isnan(y))
+    if len(idx) <= n_out:
+        return idx
+    buckets = max(n_out // 2, 1)
+    b = (np.arange(len(idx)) * buckets) // len(idx)
+    order = np.lexsort((y[idx], b))  # by bucket, then value
+    starts = np.searchsorted(b[order], np.arange(buckets))
+    ends = np.r_[starts[1:], len(order)] - 1
+    return np.unique(np.r_[idx[order[starts]], idx[order[ends]], idx[0], idx[-1]])
+
+def points_for_width(width: Optional[float]) -> int:
+    return int(min(max(width or 1000, MIN_POINTS), MAX_POINTS))
+
+def line_figure(frame: pd.DataFrame, title: str, n_points: int, names: Optional[Dict[str, str]] = None,
+                rebase: bool = False, height: int = 320, uirevision: Optional[str] = None) -> Dict[str, Any]:
+    # frame: date index x series columns. With rebase, every series starts at 100
+    # so instruments on very different scales share one axis. uirevision (default:
+    # the title) keeps the user's zoom/legend state while it stays the same.
+    traces = []
+    for col in frame.columns:
+        s = frame[col].dropna()
+        if s.empty:
+            continue
+        y = s.to_numpy(dtype="float64")
+        if rebase:
+            y = y / y[0] * 100.0
+        keep = minmax_downsample(y, n_points)
+        traces.append({"type": "scattergl" if len(keep) > 1000 else "scatter", "mode": "lines",
+                       "name": (names or {}).get(col, str(col)),
+                       "x": s.index[keep].strftime("%Y-%m-%d").tolist(), "y": np.round(y[keep], 4).tolist()})
+    rev = uirevision or title
+    layout = {"title": {"text": title}, "height": height, "margin": {"l": 10, "r": 10, "t": 35, "b": 10},
+              "uirevision": rev, "hovermode": "x unified", "legend": {"orientation": "h"}}
+    if rebase and len(frame.index):
+        # Rebased values depend on where the data starts, so a y-range the user
+        # zoomed to on the old base is meaningless: re-autoscale y when it moves.
+        layout["yaxis"] = {"uirevision": f"{rev}|{frame.index[0]}|{frame.index[-1]}"}
+    return {"data": traces, "layout": layout}
+
+class FigureCache:
+    # Small LRU of built figures, dropped wholesale when the data generation changes.
+    def __init__(self, entries: int = CACHE_ENTRIES):
+        self.entries = entries
+        self._lock = threading.Lock()
+        self._generation = None
+        self._figs: "OrderedDict[Hashable, Dict[str, Any]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, generation, key: Hashable, build: Callable[[], Dict[str, Any]]) -> Dict[str, Any]:
+        with self._lock:
+            if generation != self._generation:
+                self._figs.clear()
+                self._generation = generation
+            fig = self._figs.get(key)
+            if fig is not None:
+                self._figs.move_to_end(key)
+                self.hits += 1
+                return fig
+            self.misses += 1
+        fig = build()
+        with self._lock:
+            if generation == self._generation:
+                self._figs[key] = fig
+                while len(self._figs) > self.entries:
+                    self._figs.popitem(last=False)
+        return fig
+
+figures = FigureCache()
@@ -1,37 +1,49 @@
 
+from __future__ import annotations  # annotations name pd.DataFrame; keep them from triggering the deferred import
+
 import os
-import re
-import json
-import smtplib
-import requests
-import feedparser
-import pandas as pd
-from email.mime.text import MIMEText
-from email.utils import formataddr
-from typing import Dict, Any, List, Optional
+import time
+import sqlite3
+import hashlib
+import calendar
+from contextlib import closing
+from urllib.parse import quote
+from typing import Dict, Any, Iterator, List, Optional, Callable, Tuple
 from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from modules import metrics
+from modules.cache_store import CACHE_DIR, store
+from modules.http_client import http_get, http_post, connection_stats, breaker_stats, redact_error
+from modules.mailer import deliver
+from modules.te_client import te, te_configured
+from modules.instruments import instruments
+from modules.utils import CARRIED, BOND_TENORS
+from modules.lazy import lazy_import
+from modules.feeds import feeds, DEFAULT_LIMIT as FEED_LIMIT
+from modules.subscribers import add_subscriber, remove_subscriber, count_subscribers, iter_subscribers, iter_recipients
 
-from apscheduler.schedulers.background import BackgroundScheduler
-from apscheduler.triggers.cron import CronTrigger
+# Heavy dependencies load on first use, so a cold worker can serve the cached
+# page before they are imported (see modules/lazy.py and WARM_IMPORTS in app.py).
+pd = lazy_import("pandas")
+feedparser = lazy_import("feedparser")
+market_data = lazy_import("modules.market_data")
+timeseries = lazy_import("modules.timeseries")
+dedup = lazy_import("modules.dedup")
+digest = lazy_import("modules.digest")
 
-CACHE_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "cache")
-os.makedirs(CACHE_DIR, exist_ok=True)
 
-_scheduler: Optional[BackgroundScheduler] = None
+_scheduler = None  # BackgroundScheduler, started in the leader process
 
 def _cache_path(name:str) -> str:
     return os.path.join(CACHE_DIR, name)
 
 def _save_json(obj, name):
-    with open(_cache_path(name), "w", encoding="utf-8") as f:
-        json.dump(obj, f, ensure_ascii=False, indent=2)
+    store.write(name, obj)
 
 def _load_json(name):
-    p = _cache_path(name)
-    if not os.path.exists(p):
-        return None
-    with open(p, "r", encoding="utf-8") as f:
-        return json.load(f)
+    return store.read(name)
 
 def _is_stale(p:str, minutes:int) -> bool:
     if not os.path.exists(p):
@@ -39,317 +51,642 @@ def _is_stale(p:str, minutes:int) -> bool:
     mtime = datetime.fromtimestamp(os.path.getmtime(p), tz=timezone.utc)
     return datetime.now(timezone.utc) - mtime > timedelta(minutes=minutes)
 
+# ---------------- Concurrent fetch engine ----------------
+# Global wall-clock budget for one refresh; per-source limits below are capped by it.
+REFRESH_DEADLINE = float(os.getenv("REFRESH_DEADLINE_SECONDS", "30"))
+SOURCE_DEADLINES = {"wb_panel": 25, "te": 25, "yahoo": 20, "rss": 25}
+_pool = ThreadPoolExecutor(max_workers=int(os.getenv("FETCH_WORKERS", "32")), thread_name_prefix="fetch")
+
+Task = Tuple[Callable[[], Any], float]
+
+def _task(fn: Callable[[], Any], kind: str) -> Task:
+    return fn, SOURCE_DEADLINES.get(kind, REFRESH_DEADLINE)
+
+def _source_of(task_name: str) -> str:
+    # "yahoo:^GSPC" -> "yahoo"; one metrics series per upstream, not per call
+    return task_name.split(":", 1)[0]
+
+def _gather(tasks: Dict[str, Task], deadline: Optional[float] = None,
+            timings: Optional[Dict[str, float]] = None,
+            progress: Optional[Callable[[int, int], None]] = None) -> Tuple[Dict[str, Any], Dict[str, str]]:
+    # Run all tasks at once; returns (results, missed) where missed maps source -> reason.
+    # If given, `timings` is filled with seconds-to-finish per source and
+    # `progress(finished, total)` is called as sources come in.
+    start = time.monotonic()
+    budget = REFRESH_DEADLINE if deadline is None else deadline
+    timings = {} if timings is None else timings
+    due = {}
+    for name, (fn, limit) in tasks.items():
+        due[_pool.submit(fn)] = (name, start + min(limit, budget))
+    results, missed = {}, {}
+    pending = set(due)
+    while pending:
+        now = time.monotonic()
+        for f in [f for f in pending if due[f][1] <= now]:
+            pending.discard(f)
+            f.cancel()  # a running call can't be interrupted; its result is simply dropped
+            missed[due[f][0]] = "timeout"
+            timings[due[f][0]] = round(now - start, 3)
+            metrics.record_call(_source_of(due[f][0]), "timeout", now - start)
+        if pending:
+            done, _ = wait(pending, timeout=min(due[f][1] for f in pending) - now, return_when=FIRST_COMPLETED)
+        else:
+            done = ()
+        for f in done:
+            pending.discard(f)
+            name = due[f][0]
+            elapsed = time.monotonic() - start
+            timings[name] = round(elapsed, 3)
+            exc = f.exception()
+            if exc is None:
+                results[name] = f.result()
+            else:
+                missed[name] = redact_error(exc)  # the status is served by /cron/status
+            metrics.record_call(_source_of(name), "failure" if exc else "success", elapsed)
+        if progress:
+            progress(len(due) - len(pending), len(due))
+    return results, missed
+
 # ---------------- Email list management ----------------
-EMAIL_FILE = "email_recipients.json"
+# Backed by the SQLite store in modules/subscribers.
+def add_email_recipient(addr: str, countries: Optional[List[str]] = None, sections: Optional[List[str]] = None):
+    # countries/sections: digest preferences (None or everything = the full digest)
+    return add_subscriber(addr, *digest.normalize_prefs(countries, sections))
 
-def _valid_email(addr: str) -> bool:
-    return bool(re.match(r"^[^@\s]+@[^@\s]+\.[^@\s]+$", addr or ""))
+def remove_email_recipient(addr: str) -> bool:
+    return remove_subscriber(addr)
 
-def add_email_recipient(addr: str):
-    if not _valid_email(addr):
-        return False, "邮箱格式不正确"
-    lst = list_email_recipients()
-    if addr in lst:
-        return True, "已订阅"
-    lst.append(addr)
-    _save_json(lst, EMAIL_FILE)
-    return True, "OK"
+def count_email_recipients() -> int:
+    return count_subscribers()
 
 def list_email_recipients() -> List[str]:
-    data = _load_json(EMAIL_FILE)
-    return data if isinstance(data, list) else []
+    return list(iter_subscribers())
+
+# ---------------- Upstream endpoints ----------------
+# Overridable so benchmarks (bench/) can point every source at a local replay server.
+WB_BASE = os.getenv("WB_BASE_URL", "https://api.worldbank.org/v2")
+# Yahoo: YAHOO_BASE_URL, read by modules/market_data
+# TradingEconomics: TE_BASE_URL, read by modules/te_client
+DEEPL_URL = os.getenv("DEEPL_API_URL", "https://api-free.deepl.com/v2/translate")
+RSS_BASE = os.getenv("RSS_BASE_URL")  # if set, each feed is read from <base>/<source name>
 
 # ---------------- Translation (DeepL optional) ----------------
-def translate_to_zh(text: str) -> str:
-    # If DEEPL_API_KEY set, translate en->zh
+# Translations are cached on disk by content hash so headlines seen on a
+# previous refresh never hit DeepL again; entries expire by age and the table
+# is trimmed to a maximum row count (least recently used first).
+TRANSLATION_DB = "translations.sqlite3"
+TRANSLATION_MAX_AGE_DAYS = int(os.getenv("TRANSLATION_CACHE_DAYS", "30"))
+TRANSLATION_MAX_ROWS = int(os.getenv("TRANSLATION_CACHE_ROWS", "20000"))
+DEEPL_BATCH = 50  # DeepL accepts at most 50 `text` params per request
+
+def _translation_db() -> sqlite3.Connection:
+    conn = sqlite3.connect(_cache_path(TRANSLATION_DB), timeout=10)
+    conn.execute("CREATE TABLE IF NOT EXISTS translations "
+                 "(key TEXT PRIMARY KEY, text TEXT NOT NULL, created REAL NOT NULL, used REAL NOT NULL)")
+    return conn
+
+def _translation_key(text: str, lang: str) -> str:
+    return hashlib.sha256(f"{lang}\0{text}".encode("utf-8")).hexdigest()
+
+def _evict_translations(conn: sqlite3.Connection):
+    conn.execute("DELETE FROM translations WHERE created < ?", (time.time() - TRANSLATION_MAX_AGE_DAYS * 86400,))
+    conn.execute("DELETE FROM translations WHERE key IN (SELECT key FROM translations "
+                 "ORDER BY used DESC LIMIT -1 OFFSET ?)", (TRANSLATION_MAX_ROWS,))
+
+def _deepl_translate(texts: List[str], key: str, lang: str) -> Iterator[List[str]]:
+    # One translated list per DEEPL_BATCH chunk, in order; raises at the first chunk that fails
+    for i in range(0, len(texts), DEEPL_BATCH):
+        chunk = texts[i:i + DEEPL_BATCH]
+        data = [("auth_key", key), ("target_lang", lang)] + [("text", t) for t in chunk]
+        with metrics.span("deepl"):
+            r = http_post(DEEPL_URL, "deepl", data=data)
+        r.raise_for_status()
+        yield [x["text"] for x in r.json()["translations"]]
+
+def translate_many_to_zh(texts: List[str]) -> List[str]:
+    # If DEEPL_API_KEY set, translate en->zh; cache misses go out in batched requests
     key = os.getenv("DEEPL_API_KEY")
-    if not key or not text:
-        return text
+    if not key:
+        return list(texts)
+    lang = "ZH"
+    keys = [_translation_key(t, lang) if t else None for t in texts]
+    hits = {}
     try:
-        url = "https://api-free.deepl.com/v2/translate"
-        data = {"auth_key": key, "text": text, "target_lang": "ZH"}
-        r = requests.post(url, data=data, timeout=20)
-        r.raise_for_status()
-        j = r.json()
-        return j["translations"][0]["text"]
+        with closing(_translation_db()) as conn:
+            with conn:
+                wanted = sorted({k for k in keys if k})
+                for i in range(0, len(wanted), 500):
+                    part = wanted[i:i + 500]
+                    rows = conn.execute(f"SELECT key, text FROM translations WHERE key IN ({','.join('?' * len(part))})", part)
+                    hits.update(rows.fetchall())
+                now = time.time()
+                conn.executemany("UPDATE translations SET used=? WHERE key=?", [(now, k) for k in hits])
+            misses = {}
+            for t, k in zip(texts, keys):
+                if k and k not in hits:
+                    misses.setdefault(k, t)
+            # Each chunk is committed as soon as DeepL returns it, so a later failing
+            # chunk doesn't throw away (and make us pay again for) the earlier ones.
+            miss_keys = list(misses)
+            done = 0
+            try:
+                for translated in _deepl_translate(list(misses.values()), key, lang):
+                    fresh = dict(zip(miss_keys[done:done + len(translated)], translated))
+                    done += len(translated)
+                    with conn:
+                        conn.executemany("INSERT OR REPLACE INTO translations VALUES (?,?,?,?)",
+                                         [(k, v, now, now) for k, v in fresh.items()])
+                    hits.update(fresh)
+            finally:
+                if done:
+                    with conn:
+                        _evict_translations(conn)
     except Exception:
-        return text
+        pass  # untranslated text is an acceptable fallback for whatever didn't get translated
+    return [hits.get(k, t) if k else t for t, k in zip(texts, keys)]
+
+def translate_to_zh(text: str) -> str:
+    return translate_many_to_zh([text])[0]
 
 # ---------------- Data sources ----------------
-def _wb(series, country):
-    url = f"https://api.worldbank.org/v2/country/{country}/indicator/{series}?format=json&per_page=5"
-    r = requests.get(url, timeout=20)
-    r.raise_for_status()
-    data = r.json()
-    if not isinstance(data, list) or len(data) < 2:
-        return None
-    values = [x for x in data[1] if x.get("value") is not None]
-    if not values:
+def _yahoo_closes(symbol: str) -> List[Optional[float]]:
+    return market_data.yahoo_chart(symbol)[1]
+
+def _te_value(rec: Optional[Dict[str, Any]], *fields) -> Optional[float]:
+    if not rec:
         return None
-    values.sort(key=lambda x: x.get("date",""))
-    latest = values[-1]
-    return float(latest["value"]), latest["date"]
-
-def _yahoo_levels(tickers: Dict[str,str]) -> Dict[str, Dict[str, float]]:
-    out = {}
-    for label, symbol in tickers.items():
-        try:
-            url = f"https://query1.finance.yahoo.com/v8/finance/chart/{symbol}?range=5d&interval=1d"
-            j = requests.get(url, timeout=20).json()
-            res = j["chart"]["result"][0]
-            closes = res["indicators"]["quote"][0]["close"]
-            if closes and len(closes) >= 2:
-                last = closes[-1]; prev = closes[-2]
-                if last is None or prev is None:
-                    raise ValueError("None close")
-                chg = (last/prev - 1.0) * 100.0
-                out[label] = {"level": float(last), "change_pct": float(chg)}
-        except Exception:
-            out[label] = {"level": None, "change_pct": None}
-    return out
+    v = rec.get(fields[0])
+    for f in fields[1:]:
+        v = v or rec.get(f)
+    return float(v) if v is not None else None
 
-def _te(path:str, params=None):
-    key = os.getenv("TE_API_CLIENT_KEY")
-    secret = os.getenv("TE_API_CLIENT_SECRET")
-    if not key or not secret:
-        raise RuntimeError("TradingEconomics API keys not provided.")
-    url = f"https://api.tradingeconomics.com/{path}"
-    params = params or {}
-    params.update({"client": key, "secret": secret, "format":"json"})
-    r = requests.get(url, params=params, timeout=25)
-    r.raise_for_status()
-    return r.json()
+# Each fetch_* is split into a task builder (one task per upstream call) and an
+# assembler, so refresh_all_data can fan every call out in a single _gather.
+MACRO_COUNTRIES = {"CN":"CHN", "US":"USA", "EU":"EUU"}
+TE_COUNTRIES = {"CN":"China", "US":"United States", "EU":"Euro Area"}
+TE_PPI = "producer prices change"
+TE_POLICY_RATE = "interest rate"
+WB_GDP = "NY.GDP.MKTP.KD.ZG"
+WB_CPI = "FP.CPI.TOTL.ZG"
 
-def fetch_macro_snapshot() -> Dict[str, Any]:
+# ---------------- World Bank indicator panel ----------------
+# All World Bank data lives in one long-format panel (indicator, country, date,
+# value) stored as Parquet. Each indicator is fetched for every country in one
+# paginated request ("CHN;USA;EUU"); once the panel exists only the last few
+# years are re-requested, which also picks up revisions.
+WB_PANEL = "wb_panel.parquet"
+WB_INDICATORS = [WB_GDP, WB_CPI]
+WB_FIRST_YEAR = 1960
+WB_REVISION_YEARS = 2
+WB_PAGE_SIZE = 1000
+PANEL_COLUMNS = ["indicator", "country", "date", "value"]
+
+def load_wb_panel() -> pd.DataFrame:
+    return store.read(WB_PANEL, pd.DataFrame(columns=PANEL_COLUMNS))
+
+def _wb_panel_rows(indicator: str, countries: List[str], start: int, end: int) -> pd.DataFrame:
+    url = f"{WB_BASE}/country/{';'.join(countries)}/indicator/{indicator}"
+    rows, page, pages = [], 1, 1
+    while page <= pages:
+        r = http_get(url, "wb_panel", params={"format": "json", "per_page": WB_PAGE_SIZE, "date": f"{start}:{end}", "page": page})
+        r.raise_for_status()
+        data = r.json()
+        if not isinstance(data, list) or len(data) < 2 or not data[1]:
+            break
+        pages = int(data[0].get("pages") or 1)
+        rows.extend((indicator, x.get("countryiso3code"), int(x["date"]), x.get("value")) for x in data[1])
+        page += 1
+    return pd.DataFrame(rows, columns=PANEL_COLUMNS).astype({"date": "int64", "value": "float64"})
+
+def _panel_tasks() -> Dict[str, Task]:
+    panel = load_wb_panel()
+    end = datetime.now(timezone.utc).year
+    tasks = {}
+    for ind in WB_INDICATORS:
+        have = panel.loc[panel["indicator"] == ind, "date"]
+        start = int(have.max()) - WB_REVISION_YEARS if len(have) else WB_FIRST_YEAR
+        tasks[f"wb:panel:{ind}"] = _task(
+            lambda i=ind, a=start: _wb_panel_rows(i, list(MACRO_COUNTRIES.values()), a, end), "wb_panel")
+    return tasks
+
+def _update_wb_panel(res: Dict[str, Any]) -> pd.DataFrame:
+    fresh = [res[f"wb:panel:{ind}"] for ind in WB_INDICATORS if len(res.get(f"wb:panel:{ind}", ()))]
+    panel = load_wb_panel()
+    if not fresh:
+        return panel
+    panel = pd.concat([panel, *fresh] if len(panel) else fresh, ignore_index=True)
+    panel = panel.drop_duplicates(["indicator", "country", "date"], keep="last")
+    panel = panel.sort_values(["indicator", "country", "date"]).reset_index(drop=True)
+    store.write(WB_PANEL, panel)
+    return panel
+
+def _panel_latest(panel: pd.DataFrame) -> Dict[Tuple[str, str], float]:
+    latest = panel.dropna(subset=["value"]).sort_values("date").groupby(["indicator", "country"])["value"].last()
+    return {k: float(v) for k, v in latest.items()}
+
+def _macro_tasks() -> Dict[str, Task]:
+    tasks = _panel_tasks()
+    if te_configured():  # no point scheduling calls that can only fail
+        # PPI and policy rate for every country in one request
+        tasks["te:country"] = _task(lambda: te.countries(list(TE_COUNTRIES.values())), "te")
+    return tasks
+
+def _assemble_macro(res: Dict[str, Any]) -> Dict[str, Any]:
+    latest = _panel_latest(load_wb_panel())
+    idx = res.get("te:country") or {}
     out = {"CN":{}, "US":{}, "EU":{}}
-    mapping = {"CN":"CHN", "US":"USA", "EU":"EUU"}
-    for k, wb_code in mapping.items():
-        try:
-            gdp, _ = _wb("NY.GDP.MKTP.KD.ZG", wb_code)
-        except Exception:
-            gdp = None
-        try:
-            cpi, _ = _wb("FP.CPI.TOTL.ZG", wb_code)
-        except Exception:
-            cpi = None
-        ppi = None; policy = None
-        try:
-            te_ppi = _te(f"indicators/ppi?country={k}")
-            if isinstance(te_ppi, list) and te_ppi:
-                v = te_ppi[0].get("LatestValue")
-                if v is not None: ppi = float(v)
-        except Exception:
-            pass
-        try:
-            if k == "US":
-                te_rate = _te("federal_funds_rate")
-            else:
-                te_rate = _te(f"policy_rate/{k}")
-            if isinstance(te_rate, list) and te_rate:
-                v = te_rate[0].get("LatestValue") or te_rate[0].get("Value")
-                if v is not None: policy = float(v)
-        except Exception:
-            pass
-        out[k] = {"gdp_yoy": gdp, "cpi_yoy": cpi, "ppi_yoy": ppi, "policy_rate": policy}
+    for k, wb_code in MACRO_COUNTRIES.items():
+        country = TE_COUNTRIES[k].lower()
+        out[k] = {"gdp_yoy": latest.get((WB_GDP, wb_code)),
+                  "cpi_yoy": latest.get((WB_CPI, wb_code)),
+                  "ppi_yoy": _te_value(idx.get((country, TE_PPI)), "LatestValue"),
+                  "policy_rate": _te_value(idx.get((country, TE_POLICY_RATE)), "LatestValue", "Value")}
     return out
 
-def fetch_bonds_snapshot() -> Dict[str, Any]:
+def fetch_macro_snapshot() -> Dict[str, Any]:
+    res = _gather(_macro_tasks())[0]
+    _update_wb_panel(res)
+    return _assemble_macro(res)
+
+BOND_FALLBACK = {"10y": "^TNX", "5y": "^FVX"}
+
+def _bonds_tasks() -> Dict[str, Task]:
+    # The Yahoo fallback is fetched alongside TE instead of after it fails,
+    # so a missing/broken TE key doesn't add a second round trip.
+    tasks = {"te:bonds/major": _task(te.bonds, "te")} if te_configured() else {}
+    for tenor, symbol in BOND_FALLBACK.items():
+        tasks[f"yahoo:{symbol}"] = _task(lambda s=symbol: _yahoo_closes(s), "yahoo")
+    return tasks
+
+def _assemble_bonds(res: Dict[str, Any]) -> Dict[str, Any]:
+    out = _bonds_from(res)
+    _record_yields(out)
+    return out
+
+def _bonds_from(res: Dict[str, Any]) -> Dict[str, Any]:
     out = {"CN":{}, "US":{}, "EU":{}}
-    try:
-        data = _te("bonds/major")
-        by_ccy = {"US":"United States","CN":"China","EU":"Germany"}
-        tenors = {"1y":"1Y","5y":"5Y","10y":"10Y"}
+    idx = res.get("te:bonds/major")  # {(country, group): record}
+    if isinstance(idx, dict):
+        by_ccy = {"US":"united states","CN":"china","EU":"germany"}
         for k, cname in by_ccy.items():
-            out[k] = {}
-            for key, te_tenor in tenors.items():
-                recs = [x for x in data if x.get("Country")==cname and x.get("Group")==te_tenor]
-                if recs:
-                    v = recs[0].get("Last")
-                    chg = recs[0].get("DailyChange")
+            for key in ("1y", "5y", "10y"):
+                rec = idx.get((cname, key))
+                if rec:
+                    v = rec.get("Last")
+                    chg = rec.get("DailyChange")
                     out[k][key] = {"value": float(v) if v is not None else None,
                                    "change_bp": float(chg)*100 if chg is not None else None}
-    except Exception:
-        # Fallback for US only via Yahoo
-        out["US"] = {"1y":{"value":None,"change_bp":None},
-                     "5y":{"value":None,"change_bp":None},
-                     "10y":{"value":None,"change_bp":None}}
-        try:
-            j = requests.get("https://query1.finance.yahoo.com/v8/finance/chart/^TNX?range=5d&interval=1d", timeout=20).json()
-            closes = j["chart"]["result"][0]["indicators"]["quote"][0]["close"]
-            if closes and len(closes) >= 2 and closes[-1] is not None:
-                last = closes[-1]/10.0; prev = (closes[-2] or last)/10.0
-                out["US"]["10y"] = {"value": last, "change_bp": (last-prev)*100}
-        except Exception:
-            pass
-        try:
-            j = requests.get("https://query1.finance.yahoo.com/v8/finance/chart/^FVX?range=5d&interval=1d", timeout=20).json()
-            closes = j["chart"]["result"][0]["indicators"]["quote"][0]["close"]
-            if closes and len(closes) >= 2 and closes[-1] is not None:
-                last = closes[-1]/10.0; prev = (closes[-2] or last)/10.0
-                out["US"]["5y"] = {"value": last, "change_bp": (last-prev)*100}
-        except Exception:
-            pass
+    for k in out:  # every tenor is always present, so a missing one can be carried forward
+        for _, key in BOND_TENORS:
+            out[k].setdefault(key, {"value": None, "change_bp": None})
+    # US tenors TE didn't provide (no key, bad payload, or no such rows) come from Yahoo
+    for tenor in ("1y", "5y", "10y"):
+        if (out["US"].get(tenor) or {}).get("value") is not None:
+            continue
+        closes = res.get(f"yahoo:{BOND_FALLBACK[tenor]}") if tenor in BOND_FALLBACK else None
+        if closes and len(closes) >= 2 and closes[-1] is not None:
+            last = closes[-1]/10.0; prev = (closes[-2] or closes[-1])/10.0
+            out["US"][tenor] = {"value": last, "change_bp": (last-prev)*100}
+    return out
+
+def fetch_bonds_snapshot() -> Dict[str, Any]:
+    return _assemble_bonds(_gather(_bonds_tasks())[0])
+
+# ---------------- History (modules/timeseries) ----------------
+# Each refresh appends what it saw: full daily closes per market instrument
+# ("market", series = instrument id) and one yield reading per day per
+# country/tenor ("yields", series = "US:10y").
+def _record_history(dataset: str, obs: pd.DataFrame):
+    try:
+        timeseries.append(dataset, obs)
+    except Exception as e:  # history is best-effort; never lose the snapshot over it
+        print(f"History append failed ({dataset}):", e)
+
+def _record_yields(bonds: Dict[str, Any]):
+    today = pd.Timestamp(datetime.now(timezone.utc).date())
+    rows = [(f"{k}:{tenor}", today, v.get("value")) for k, block in bonds.items()
+            for tenor, v in block.items() if isinstance(v, dict) and v.get("value") is not None]
+    _record_history("yields", pd.DataFrame(rows, columns=timeseries.COLUMNS))
+
+def load_history(dataset: str, series: Optional[List[str]] = None, start=None, end=None) -> pd.DataFrame:
+    # Date x series matrix for [start, end]
+    return timeseries.query_wide(dataset, series, start, end)
+
+# Market instruments (indices, FX, ...) come from the registry in
+# instruments.json; symbols are fetched in spark chunks, one task per chunk.
+def _stocks_tasks() -> Dict[str, Task]:
+    symbols = list(dict.fromkeys(i.symbol for i in instruments(source="yahoo")))
+    return {f"yahoo:spark:{n}": _task(lambda c=chunk: market_data.yahoo_spark(c), "yahoo")
+            for n, chunk in enumerate(market_data.chunks(symbols))}
+
+def _assemble_stocks(res: Dict[str, Any]) -> Dict[str, Any]:
+    # {country: {instrument id: {level, change_pct, vol_20d, zscore}}}
+    series = {}
+    for k, v in res.items():
+        if k.startswith("yahoo:spark:"):
+            series.update(v)
+    items = instruments(source="yahoo")
+    closes = market_data.closes_matrix({i.id: series[i.symbol] for i in items if i.symbol in series})
+    if not closes.empty:
+        obs = closes.rename_axis(index="ts", columns="series").stack().rename("value").reset_index()
+        _record_history("market", obs)
+    stats = market_data.market_stats(closes)
+    out: Dict[str, Dict[str, Any]] = {}
+    for i in items:
+        row = stats.loc[i.id] if i.id in stats.index else None
+        out.setdefault(i.country, {})[i.id] = {
+            f: (None if row is None or pd.isna(row[f]) else float(row[f])) for f in ("level", "change_pct", "vol_20d", "zscore")}
     return out
 
 def fetch_stocks_snapshot() -> Dict[str, Any]:
-    cn = _yahoo_levels({"mkt1":"000001.SS", "mkt2":"399001.SZ"})
-    us = _yahoo_levels({"mkt1":"^GSPC", "mkt2":"^IXIC"})
-    eu = _yahoo_levels({"mkt1":"^FTSE", "mkt2":"^GDAXI"})
-    return {"CN": cn, "US": us, "EU": eu}
-
-def fetch_news_items(limit:int=30) -> List[Dict[str,Any]]:
-    feeds = [
-        ("新华社", "http://www.xinhuanet.com/english/rss/businessrss.xml"),
-        ("路透", "https://feeds.reuters.com/reuters/businessNews"),
-        ("人民银行", "http://www.pbc.gov.cn/english/130721/rss.xml"),
-        ("国家统计局", "http://www.stats.gov.cn/english/rss.xml"),
-        ("ECB", "https://www.ecb.europa.eu/press/press.rss"),
-        ("FED", "https://www.federalreserve.gov/feeds/press_all.xml"),
-    ]
-    cn_like = {"新华社","人民银行","国家统计局"}  # do not translate
-    items = []
-    for source, url in feeds:
-        try:
-            d = feedparser.parse(url)
-            for e in d.entries[:10]:
-                title = e.get("title","") or ""
-                summary = e.get("summary","") or ""
-                pub_time = e.get("published","")[:19]
-                link = e.get("link","")
-                # Auto-translate non-CN sources if key available
-                if source not in cn_like:
-                    title = translate_to_zh(title)
-                    summary = translate_to_zh(summary[:500])
-                items.append({
-                    "source": source,
-                    "title": title,
-                    "summary": summary,
-                    "link": link,
-                    "pub_time": pub_time
-                })
-        except Exception:
+    return _assemble_stocks(_gather(_stocks_tasks())[0])
+
+# Feeds come from the registry in feeds.json (modules/feeds), one task each.
+# Ingestion is incremental: each feed's ETag/Last-Modified is replayed so an
+# unchanged feed costs a 304, and entries are keyed by a GUID/link hash so only
+# unseen ones are processed. New entries are then clustered against each other
+# and everything already stored (MinHash/LSH over the original title+summary,
+# modules/dedup); only one item per story is kept and translated, the others
+# are recorded as duplicates. Items age out by publish time; the ids each feed
+# listed last time are kept with the feed, so an aged-out entry never returns.
+NEWS_STORE = "news_store.json"
+NEWS_MAX_AGE_HOURS = float(os.getenv("NEWS_MAX_AGE_HOURS", "72"))
+
+def _entry_id(e) -> str:
+    ident = e.get("id") or e.get("guid") or e.get("link") or e.get("title") or ""
+    return hashlib.sha1(ident.encode("utf-8")).hexdigest()
+
+def _entry_ts(e) -> float:
+    st = e.get("published_parsed") or e.get("updated_parsed")
+    return float(calendar.timegm(st)) if st else time.time()
+
+def _feed_items(source: str, url: str, etag: Optional[str] = None, modified: Optional[str] = None,
+                limit: int = FEED_LIMIT, translate: bool = True) -> Dict[str,Any]:
+    # Fetched through the shared session (timeout, breaker, pooled connections), not
+    # feedparser's own urllib, which has no timeout; feedparser only parses the body.
+    headers = {}
+    if etag:
+        headers["If-None-Match"] = etag
+    if modified:
+        headers["If-Modified-Since"] = modified
+    r = http_get(url, "rss", headers=headers)
+    out = {"etag": r.headers.get("ETag", etag), "modified": r.headers.get("Last-Modified", modified), "items": []}
+    if r.status_code == 304:
+        out["not_modified"] = True
+        return out
+    r.raise_for_status()
+    d = feedparser.parse(r.content, response_headers={"content-type": r.headers.get("Content-Type", ""),
+                                                      "content-location": r.url})
+    for e in d.entries[:limit]:
+        title = e.get("title","") or ""
+        summary = e.get("summary","") or ""
+        pub_time = e.get("published","")[:19]
+        link = e.get("link","")
+        if translate:
+            summary = summary[:500]
+        out["items"].append({
+            "id": _entry_id(e),
+            "source": source,
+            "title": title,
+            "summary": summary,
+            "link": link,
+            "pub_time": pub_time,
+            "ts": _entry_ts(e),
+            "translate": translate,
+        })
+    return out
+
+def _load_news_store() -> Dict[str, Any]:
+    # Shallow copies: the cached object is shared with other readers
+    saved = _load_json(NEWS_STORE) or {}
+    return {"feeds": dict(saved.get("feeds", {})), "items": dict(saved.get("items", {})),
+            "dups": dict(saved.get("dups", {}))}
+
+def _news_tasks() -> Dict[str, Task]:
+    known = _load_news_store()["feeds"]
+    tasks = {}
+    for f in feeds():
+        v = known.get(f.url, {})
+        fetch_url = f"{RSS_BASE}/{quote(f.source)}" if RSS_BASE else f.url
+        tasks[f"rss:{f.source}"] = _task(lambda f=f, u=fetch_url, et=v.get("etag"), md=v.get("modified"):
+                                         _feed_items(f.source, u, et, md, f.limit, f.translate), "rss")
+    return tasks
+
+def _assemble_news(res: Dict[str, Any], limit: Optional[int] = None) -> List[Dict[str,Any]]:
+    news = _load_news_store()
+    known = news["items"]
+    cutoff = time.time() - NEWS_MAX_AGE_HOURS * 3600
+    dups = news["dups"]
+    new = {}
+    for f in feeds():
+        r = res.get(f"rss:{f.source}")
+        if not r:
+            continue
+        # Ids the feed listed at its last full fetch were handled then, even once they have aged
+        # out of items/dups; undated entries (ts = fetch time) would otherwise come back as new.
+        seen = news["feeds"].get(f.url, {}).get("seen", [])
+        news["feeds"][f.url] = {"etag": r.get("etag"), "modified": r.get("modified"),
+                                "seen": seen if r.get("not_modified") else [it["id"] for it in r["items"]]}
+        seen = set(seen)
+        for it in r["items"]:
+            if it["id"] in seen:
+                continue
+            if it["ts"] >= cutoff and it["id"] not in known and it["id"] not in dups and it["id"] not in new:
+                new[it["id"]] = it
+    # Cluster before translating: stored items first, then untranslated sources, so
+    # a story's representative is preferably one that doesn't need DeepL at all.
+    index = dedup.LSHIndex()
+    for k, it in known.items():
+        if it.get("mh"):
+            index.add(k, dedup.decode(it["mh"]))
+    keep = {}
+    for it in sorted(new.values(), key=lambda it: (it.get("translate", True), it["ts"])):
+        sig = dedup.signature(it["title"] + " " + it["summary"])
+        rep = index.query(sig)
+        if rep is None:
+            it["mh"] = dedup.encode(sig)
+            index.add(it["id"], sig)
+            keep[it["id"]] = it
             continue
+        dups[it["id"]] = {"rep": rep, "source": it["source"], "ts": it["ts"]}
+        target = keep.get(rep) or known[rep]
+        if it["source"] != target["source"] and it["source"] not in target.get("also", []):
+            target = {**target, "also": target.get("also", []) + [it["source"]]}  # stored items are shared; copy
+            (keep if rep in keep else known)[rep] = target
+    # Auto-translate if key available: new representatives only, all feeds in one batch
+    foreign = [it for it in keep.values() if it.get("translate", True)]
+    texts = translate_many_to_zh([it["title"] for it in foreign] + [it["summary"] for it in foreign])
+    for i, it in enumerate(foreign):
+        it["title"], it["summary"] = texts[i], texts[len(foreign) + i]
+    known.update(keep)
+    news["items"] = {k: it for k, it in known.items() if it.get("ts", 0) >= cutoff}
+    news["dups"] = {k: d for k, d in dups.items() if d.get("ts", 0) >= cutoff}
+    _save_json(news, NEWS_STORE)
+    items = sorted(({k: v for k, v in it.items() if k != "mh"} for it in news["items"].values()),
+                   key=lambda it: it.get("ts", 0), reverse=True)
     # Deduplicate by title
     seen = set(); uniq = []
     for it in items:
         t = it["title"]
         if t and t not in seen:
             seen.add(t); uniq.append(it)
-    return uniq[:limit]
+    return uniq[:limit] if limit else uniq
+
+def fetch_news_items(limit: Optional[int] = None) -> List[Dict[str,Any]]:
+    return _assemble_news(_gather(_news_tasks())[0], limit)
+
+def _assemble_history(res: Dict[str, Any]) -> Optional[pd.DataFrame]:
+    # Wide CPI table for the trend chart, pivoted straight out of the panel
+    panel = load_wb_panel()
+    cpi = panel[panel["indicator"] == WB_CPI]
+    if cpi.empty:
+        return None
+    names = {wb: f"{k}-CPI" for k, wb in MACRO_COUNTRIES.items()}
+    out = cpi.pivot(index="date", columns="country", values="value").rename(columns=names).dropna(how="all")
+    out.columns.name = None
+    return out[[c for c in names.values() if c in out.columns]].reset_index().sort_values("date")
 
 # ---------------- Orchestration & scheduler ----------------
 def load_cached_macro_snapshot() -> Dict[str, Any]: return _load_json("macro_snapshot.json") or {}
-def load_cached_time_series() -> pd.DataFrame:
-    p = _cache_path("macro_history.csv")
-    return pd.read_csv(p) if os.path.exists(p) else pd.DataFrame()
+def load_cached_time_series() -> pd.DataFrame: return store.read("macro_history.csv", pd.DataFrame())
 def load_cached_stocks_snapshot() -> Dict[str, Any]: return _load_json("stocks_snapshot.json") or {}
 def load_cached_bonds_snapshot() -> Dict[str, Any]: return _load_json("bonds_snapshot.json") or {}
 def load_cached_news_items() -> List[Dict[str, Any]]: return _load_json("news_items.json") or []
 
-def refresh_all_data(force_if_stale_minutes:int=60):
-    if _is_stale(_cache_path("macro_snapshot.json"), force_if_stale_minutes):
-        _save_json(fetch_macro_snapshot(), "macro_snapshot.json")
-    if _is_stale(_cache_path("bonds_snapshot.json"), force_if_stale_minutes):
-        _save_json(fetch_bonds_snapshot(), "bonds_snapshot.json")
-    if _is_stale(_cache_path("stocks_snapshot.json"), 20):
-        _save_json(fetch_stocks_snapshot(), "stocks_snapshot.json")
-    if _is_stale(_cache_path("news_items.json"), 30):
-        _save_json(fetch_news_items(), "news_items.json")
-    # CPI history (yearly) refresh ~ monthly
-    if _is_stale(_cache_path("macro_history.csv"), 720):
-        series = {"CN":"CHN","US":"USA","EU":"EUU"}
-        frames = []
-        for k, wb in series.items():
-            try:
-                url = f"https://api.worldbank.org/v2/country/{wb}/indicator/FP.CPI.TOTL.ZG?format=json&per_page=200"
-                r = requests.get(url, timeout=25).json()
-                vals = r[1]
-                df = pd.DataFrame([{"date": int(v["date"]), f"{k}-CPI": v["value"]} for v in vals])
-                frames.append(df)
-            except Exception:
-                pass
-        if frames:
-            out = frames[0]
-            for f in frames[1:]:
-                out = pd.merge(out, f, on="date", how="outer")
-            out = out.sort_values("date")
-            out.to_csv(_cache_path("macro_history.csv"), index=False)
+REFRESH_STATUS_FILE = "refresh_status.json"
+
+def _missing(v: Any) -> bool:
+    # None, an empty block, or a reading whose value/level came back empty
+    if v is None or v == {}:
+        return True
+    return isinstance(v, dict) and any(f in v for f in ("value", "level")) and v.get("value", v.get("level")) is None
+
+# Values carried forward are stamped with when they were last fetched
+# (snapshot["_carried"][country][field], UTC ISO time; cards show the date)
+# and dropped after CARRY_MAX_HOURS, so a source that never recovers ends up
+# as "—" instead of a frozen number.
+CARRY_MAX_HOURS = float(os.getenv("CARRY_FORWARD_MAX_HOURS", "168"))
+
+def _merge_missed(fresh: Dict[str, Any], previous: Dict[str, Any], previous_at: float) -> Dict[str, Any]:
+    # Keep the last good value for anything that came back empty this round
+    # (source timed out, failed, or had no data), per country and per field/tenor.
+    # Only keys the fresh result defines are considered: assemblers emit every
+    # registry key, so renamed or removed ones drop out of the snapshot.
+    # previous_at: when the previous snapshot was written (its non-carried values were fresh then).
+    before = previous.get(CARRIED) or {}
+    cutoff = time.time() - CARRY_MAX_HOURS * 3600
+    carried: Dict[str, Dict[str, str]] = {}
+    for k, block in fresh.items():
+        prev = previous.get(k)
+        if not isinstance(block, dict) or not isinstance(prev, dict):
+            continue
+        for field in block:
+            old = prev.get(field)
+            if not _missing(block[field]) or _missing(old):
+                continue
+            as_of = (before.get(k) or {}).get(field) or datetime.fromtimestamp(previous_at, tz=timezone.utc).isoformat()
+            if datetime.fromisoformat(as_of).timestamp() >= cutoff:
+                block[field] = old
+                carried.setdefault(k, {})[field] = as_of
+    fresh[CARRIED] = carried
+    return fresh
+
+DATA_FILES = ["macro_snapshot.json", "stocks_snapshot.json", "bonds_snapshot.json",
+              "news_items.json", "macro_history.csv"]
+
+def cache_generation() -> Tuple[int, ...]:
+    # Changes whenever any file the dashboard renders from is rewritten.
+    return tuple(store.version(name) for name in DATA_FILES)
+
+SNAPSHOT_FILES = ["macro_snapshot.json", "stocks_snapshot.json", "bonds_snapshot.json"]
+
+def snapshot_version() -> int:
+    # Monotonic: each write bumps one file's store version by one.
+    return sum(store.version(name) for name in SNAPSHOT_FILES)
+
+def refresh_all_data(force_if_stale_minutes:int=60, deadline: Optional[float] = None,
+                     progress: Optional[Callable[[int, int], None]] = None):
+    # (cache file, staleness in minutes, task builder, assembler)
+    groups = [
+        ("macro_snapshot.json", force_if_stale_minutes, _macro_tasks, _assemble_macro),
+        ("bonds_snapshot.json", force_if_stale_minutes, _bonds_tasks, _assemble_bonds),
+        ("stocks_snapshot.json", 20, _stocks_tasks, _assemble_stocks),
+        ("news_items.json", 30, _news_tasks, _assemble_news),
+        # CPI history (yearly) refresh ~ monthly
+        ("macro_history.csv", 720, _panel_tasks, _assemble_history),
+    ]
+    groups = [g for g in groups if _is_stale(_cache_path(g[0]), g[1])]
+    if not groups:
+        return {}
+    tasks = {}
+    for g in groups:
+        tasks.update(g[2]())
+    started = datetime.now(timezone.utc)
+    t0 = time.monotonic()
+    timings = {}
+    res, missed = _gather(tasks, deadline, timings, progress)
+    _update_wb_panel(res)
+    for name, _, _, assemble in groups:
+        out = assemble(res)
+        if name.endswith(".csv"):
+            if out is not None:
+                store.write(name, out)
+        elif name == "news_items.json":
+            _save_json(out, name)
+        else:
+            p = _cache_path(name)
+            _save_json(_merge_missed(out, _load_json(name) or {}, os.path.getmtime(p) if os.path.exists(p) else time.time()), name)
+    duration = time.monotonic() - t0
+    metrics.observe("refresh_duration_seconds", duration)
+    metrics.flush()
+    status = {
+        "started": started.isoformat(),
+        "duration_s": round(duration, 3),
+        "sources": len(tasks),
+        "ok": sorted(res),
+        "missed": missed,
+        "timings": timings,
+        "http": connection_stats(),
+        "breakers": breaker_stats(),
+        "cache": store.stats(),
+    }
+    _save_json(status, REFRESH_STATUS_FILE)
+    return status
+
+def load_refresh_status() -> Dict[str, Any]: return _load_json(REFRESH_STATUS_FILE) or {}
 
 # ---------------- Email sending ----------------
-def _send_via_sendgrid(to_list: List[str], subject: str, html_body: str) -> int:
-    key = os.getenv("SENDGRID_API_KEY")
-    sender = os.getenv("EMAIL_SENDER")  # e.g., no-reply@yourdomain.com
-    if not key or not sender:
-        return 0
-    try:
-        import sendgrid
-        from sendgrid.helpers.mail import Mail, Email, To, Content
-        sg = sendgrid.SendGridAPIClient(api_key=key)
-        sent = 0
-        for to in to_list:
-            message = Mail(from_email=Email(sender),
-                           to_emails=To(to),
-                           subject=subject,
-                           html_content=html_body)
-            resp = sg.client.mail.send.post(request_body=message.get())
-            if 200 <= resp.status_code < 300:
-                sent += 1
-        return sent
-    except Exception:
-        return 0
+# The digest is rendered from the cached snapshots at most once per day and
+# data version (see modules/digest); each subscriber segment then reuses it.
+_digest_cache: Dict[str, Any] = {"key": None, "digest": None}
 
-def _send_via_smtp(to_list: List[str], subject: str, html_body: str) -> int:
-    host = os.getenv("SMTP_HOST")
-    port = int(os.getenv("SMTP_PORT","587"))
-    user = os.getenv("SMTP_USER")
-    pwd = os.getenv("SMTP_PASS")
-    sender = os.getenv("EMAIL_SENDER") or user
-    if not (host and user and pwd and sender):
-        return 0
-    msg = MIMEText(html_body, "html", "utf-8")
-    msg["From"] = formataddr(("Macro Dashboard", sender))
-    msg["Subject"] = subject
-    sent = 0
-    try:
-        with smtplib.SMTP(host, port, timeout=20) as s:
-            s.starttls()
-            s.login(user, pwd)
-            for to in to_list:
-                msg["To"] = to
-                s.sendmail(sender, [to], msg.as_string())
-                sent += 1
-    except Exception:
-        return 0
-    return sent
+def build_digest():
+    day = datetime.now(ZoneInfo("Asia/Shanghai")).strftime("%Y-%m-%d")
+    key = (day, cache_generation())  # read before the data, so the digest never claims newer data than it holds
+    if _digest_cache["key"] != key:
+        _digest_cache["digest"] = digest.Digest(load_cached_macro_snapshot(), load_cached_bonds_snapshot(),
+                                                load_cached_stocks_snapshot(), load_cached_news_items())
+        _digest_cache["key"] = key
+    return _digest_cache["digest"]
 
-def send_daily_email_summary() -> int:
-    to_list = list_email_recipients()
-    if not to_list:
+def send_daily_email_summary(run_id: Optional[str] = None) -> int:
+    # Delivery is tracked per run in modules/mailer's ledger; the default run is
+    # today's digest (Asia/Shanghai), so a retry the same day resumes instead of resending.
+    if not count_subscribers():
         return 0
-    macro = load_cached_macro_snapshot()
-    stocks = load_cached_stocks_snapshot()
-    bonds = load_cached_bonds_snapshot()
-    news = load_cached_news_items()[:8]
-    def fmt_macro(k, name):
-        b = macro.get(k, {})
-        return f"<b>{name}</b> GDP:{b.get('gdp_yoy','—')} CPI:{b.get('cpi_yoy','—')} PPI:{b.get('ppi_yoy','—')} Rate:{b.get('policy_rate','—')}"
-    html_body = "<h3>每日宏观与金融摘要</h3>" + \
-        "<p>" + "<br>".join([fmt_macro("CN","中国"), fmt_macro("US","美国"), fmt_macro("EU","欧盟")]) + "</p>" + \
-        "<h4>新闻</h4><ul>" + "".join([f"<li>{i.get('source','')}: <a href='{i.get('link','#')}'>{i.get('title','')}</a></li>" for i in news]) + "</ul>" + \
-        f"<p style='color:#888;'>发送时间：{datetime.utcnow().isoformat()}Z</p>"
-    subject = "每日宏观与金融摘要"
-    sent = _send_via_sendgrid(to_list, subject, html_body)
-    if sent == 0:
-        sent = _send_via_smtp(to_list, subject, html_body)
-    return sent
+    d = build_digest()
+    run_id = run_id or "digest-" + d.generated.strftime("%Y-%m-%d")
+    return deliver(run_id, iter_recipients(), d.message)["sent"]
 
 # ------------- Scheduler init -------------
-def ensure_scheduler_started():
+def ensure_scheduler_started(daily_job: Optional[Callable[[], Any]] = None):
     global _scheduler
     if _scheduler and _scheduler.running:
         return
+    from apscheduler.schedulers.background import BackgroundScheduler
+    from apscheduler.triggers.cron import CronTrigger
     _scheduler = BackgroundScheduler(timezone="Asia/Shanghai")
     # Every day at 08:00 China time
-    _scheduler.add_job(lambda: (refresh_all_data(force_if_stale_minutes=0), send_daily_email_summary()),
+    _scheduler.add_job(daily_job or (lambda: (refresh_all_data(force_if_stale_minutes=0), send_daily_email_summary())),
                        CronTrigger(hour=8, minute=0))
     _scheduler.start()
@@ -0,0 +1,76 @@
+
+import os
+import re
+import html
+import base64
+import hashlib
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+# Near-duplicate detection for news: normalized title+summary -> 3-token
+# shingles (words for Latin text, single characters for CJK) -> 64-value
+# MinHash signature -> LSH with 16 bands of 4 rows. Candidates sharing a band
+# are confirmed by the estimated Jaccard similarity, so lookups stay O(1) per
+# item no matter how many items are indexed.
+NUM_PERM = 64
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+SHINGLE = 3
+THRESHOLD = float(os.getenv("NEWS_DUP_THRESHOLD", "0.5"))
+
+# Fixed seed: signatures are persisted in the news store and must stay comparable across processes.
+_rng = np.random.default_rng(20250809)
+_A = _rng.integers(1, 2**63, NUM_PERM, dtype=np.uint64) | np.uint64(1)
+_B = _rng.integers(0, 2**63, NUM_PERM, dtype=np.uint64)
+_TOKEN = re.compile(r"[a-z0-9]+|[\u3400-\u9fff]")
+_TAG = re.compile(r"<[^>]+>")
+
+def normalize(text: str) -> List[str]:
+    return _TOKEN.findall(html.unescape(_TAG.sub(" ", text or "")).lower())
+
+def _shingles(tokens: List[str]) -> np.ndarray:
+    grams = {" ".join(tokens[i:i + SHINGLE]) for i in range(max(len(tokens) - SHINGLE + 1, 1))}
+    return np.array([int.from_bytes(hashlib.blake2b(g.encode("utf-8"), digest_size=8).digest(), "little")
+                     for g in grams], dtype=np.uint64)
+
+def signature(text: str) -> np.ndarray:
+    # Min over shingles of (a*x + b) >> 32 for each of NUM_PERM multiply-shift hashes (uint64 wraps by design).
+    x = _shingles(normalize(text))
+    with np.errstate(over="ignore"):
+        h = (x[:, None] * _A[None, :] + _B[None, :]) >> np.uint64(32)
+    return h.min(axis=0).astype(np.uint32)
+
+def similarity(a: np.ndarray, b: np.ndarray) -> float:
+    return float(np.mean(a == b))
+
+def encode(sig: np.ndarray) -> str:
+    return base64.b64encode(sig.astype("<u4").tobytes()).decode("ascii")
+
+def decode(s: str) -> np.ndarray:
+    return np.frombuffer(base64.b64decode(s), dtype="<u4")
+
+class LSHIndex:
+    def __init__(self, threshold: float = THRESHOLD):
+        self.threshold = threshold
+        self.buckets: Dict[Tuple[int, bytes], List[str]] = {}
+        self.sigs: Dict[str, np.ndarray] = {}
+
+    def _bands(self, sig: np.ndarray):
+        for b in range(BANDS):
+            yield b, sig[b * ROWS:(b + 1) * ROWS].tobytes()
+
+    def add(self, key: str, sig: np.ndarray):
+        self.sigs[key] = sig
+        for band in self._bands(sig):
+            self.buckets.setdefault(band, []).append(key)
+
+    def query(self, sig: np.ndarray) -> Optional[str]:
+        # Most similar indexed key at or above the threshold, if any
+        cands = {k for band in self._bands(sig) for k in self.buckets.get(band, ())}
+        best, score = None, self.threshold
+        for k in cands:
+            s = similarity(sig, self.sigs[k])
+            if s >= score:
+                best, score = k, s
+        return best
@@ -0,0 +1,112 @@
+
+import os
+from datetime import datetime
+from zoneinfo import ZoneInfo
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import jinja2
+from markupsafe import Markup
+
+from modules import metrics
+from modules.mailer import Message
+from modules.instruments import countries, groups
+from modules.utils import macro_rows, bonds_rows, market_rows
+
+# Daily email digest, rendered once and assembled per segment. A segment is a
+# subscriber preference (countries x sections, see modules/subscribers). Each
+# (section, country) block is rendered at most once per digest, in HTML and
+# plain text, and every segment's email is just those fragments stitched into
+# the layout, so rendering cost grows with the number of distinct segments,
+# not subscribers. Templates are compiled at import.
+SECTIONS = {"macro": "宏观指标", "bonds": "国债收益率", "market": "股指与汇率", "news": "重点新闻"}
+PER_COUNTRY = ("macro", "bonds", "market")
+NEWS_ITEMS = int(os.getenv("DIGEST_NEWS_ITEMS", "8"))
+SUBJECT = "每日宏观与金融摘要"
+TZ = ZoneInfo("Asia/Shanghai")
+
+_html = jinja2.Environment(autoescape=True, trim_blocks=True, lstrip_blocks=True, keep_trailing_newline=True,
+                           undefined=jinja2.StrictUndefined)
+_text = jinja2.Environment(autoescape=False, keep_trailing_newline=True, undefined=jinja2.StrictUndefined)  # newlines are content here
+
+HTML = {
+    "rows": _html.from_string(
+        "<p style='margin:4px 0;'><b>{{ country }}</b>："
+        "{% for label, text in rows %}{{ label }} {{ text or '—' }}{% if not loop.last %}｜{% endif %}{% endfor %}</p>\n"),
+    "news": _html.from_string(
+        "<ul>\n{% for i in items %}<li>{{ i.source }}: <a href='{{ i.link }}'>{{ i.title }}</a>"
+        "{% if i.also %} <span style='color:#888;'>（另见：{{ i.also | join('、') }}）</span>{% endif %}</li>\n{% endfor %}</ul>\n"),
+    "layout": _html.from_string(
+        "<h3>{{ subject }}</h3>\n{% for title, parts in sections %}<h4>{{ title }}</h4>\n{% for p in parts %}{{ p }}{% endfor %}{% endfor %}"
+        "<p style='color:#888;'>生成时间：{{ generated }}（北京时间）｜订阅内容：{{ prefs }}。"
+        "如需调整，在页面底部用同一邮箱重新提交订阅即可。</p>\n"),
+}
+TEXT = {
+    "rows": _text.from_string("{{ country }}：{% for label, text in rows %}{{ label }} {{ text or '—' }}{% if not loop.last %}｜{% endif %}{% endfor %}\n"),
+    "news": _text.from_string("{% for i in items %}- {{ i.source }}: {{ i.title }}{% if i.also %}（另见：{{ i.also | join('、') }}）{% endif %}\n  {{ i.link }}\n{% endfor %}"),
+    "layout": _text.from_string(
+        "{{ subject }}\n\n{% for title, parts in sections %}【{{ title }}】\n{% for p in parts %}{{ p }}{% endfor %}\n{% endfor %}"
+        "生成时间：{{ generated }}（北京时间）｜订阅内容：{{ prefs }}\n如需调整，在页面底部用同一邮箱重新提交订阅即可。\n"),
+}
+
+def normalize_prefs(country_keys: Optional[Iterable[str]], section_keys: Optional[Iterable[str]]) -> Tuple[Tuple[str, ...], Tuple[str, ...]]:
+    # Known keys in registry order; an empty tuple means "all", so every way of picking everything is one segment.
+    known_c, known_s = list(countries()), list(SECTIONS)
+    cs = tuple(c for c in known_c if c in {x.strip().upper() for x in country_keys or () if x})
+    ss = tuple(s for s in known_s if s in {x.strip().lower() for x in section_keys or () if x})
+    return (() if len(cs) == len(known_c) else cs), (() if len(ss) == len(known_s) else ss)
+
+def parse_segment(segment: str) -> Tuple[Tuple[str, ...], Tuple[str, ...]]:
+    # "CN,US|macro,news" -> normalized prefs; "" or "|" -> everything
+    c, _, s = (segment or "").partition("|")
+    return normalize_prefs(c.split(","), s.split(","))
+
+class Digest:
+    def __init__(self, macro: Dict[str, Any], bonds: Dict[str, Any], market: Dict[str, Any],
+                 news: List[Dict[str, Any]], generated: Optional[datetime] = None):
+        self.data = {"macro": macro or {}, "bonds": bonds or {}, "market": market or {}}
+        self.news = (news or [])[:NEWS_ITEMS]
+        self.generated = generated or datetime.now(TZ)
+        self._fragments: Dict[Tuple[str, Optional[str]], Tuple[str, str]] = {}
+        self._messages: Dict[Tuple[Tuple[str, ...], Tuple[str, ...]], Message] = {}
+
+    def _rows(self, section: str, country: str) -> List[Tuple[str, Optional[str]]]:
+        data = self.data[section]
+        if section == "macro":
+            rows = macro_rows(data, country)
+        elif section == "bonds":
+            rows = bonds_rows(data, country)
+        else:
+            rows = [r for g in groups() for r in market_rows(data, g, country)]
+        return [(label, text) for _, label, text in rows]
+
+    def fragment(self, section: str, country: Optional[str] = None) -> Tuple[str, str]:
+        # (html, text) for one block, rendered on first use
+        key = (section, country)
+        if key not in self._fragments:
+            if section == "news":
+                ctx = {"items": [{"source": i.get("source", ""), "title": i.get("title", ""), "link": i.get("link", "#"),
+                                  "also": i.get("also", [])} for i in self.news]}
+                tpl = "news"
+            else:
+                ctx = {"country": countries()[country], "rows": self._rows(section, country)}
+                tpl = "rows"
+            self._fragments[key] = (HTML[tpl].render(ctx), TEXT[tpl].render(ctx))
+            metrics.inc("digest_renders_total", kind="fragment")
+        return self._fragments[key]
+
+    def message(self, segment: str = "") -> Message:
+        # The email for one segment, assembled from the shared fragments
+        prefs = parse_segment(segment)
+        if prefs not in self._messages:
+            cs = prefs[0] or tuple(countries())
+            ss = prefs[1] or tuple(SECTIONS)
+            blocks = [(SECTIONS[s], [self.fragment(s, c) for c in cs] if s in PER_COUNTRY else [self.fragment(s)])
+                      for s in ss]
+            ctx = {"subject": SUBJECT, "generated": self.generated.strftime("%Y-%m-%d %H:%M"),
+                   "prefs": "、".join([countries()[c] for c in prefs[0]] or ["全部国家/地区"]) + "；" +
+                            "、".join([SECTIONS[s] for s in prefs[1]] or ["全部栏目"])}
+            html_body = HTML["layout"].render(ctx, sections=[(t, [Markup(h) for h, _ in parts]) for t, parts in blocks])
+            text_body = TEXT["layout"].render(ctx, sections=[(t, [x for _, x in parts]) for t, parts in blocks])
+            self._messages[prefs] = Message(SUBJECT, html_body, text_body)
+            metrics.inc("digest_renders_total", kind="segment")
+        return self._messages[prefs]
@@ -0,0 +1,28 @@
+
+import os
+import json
+from typing import List, NamedTuple, Optional
+
+# News feed registry (feeds.json): one entry per RSS/Atom feed. Feeds are
+# fetched concurrently by the refresh, so the list can grow to hundreds.
+FEEDS_FILE = os.getenv("FEEDS_FILE") or os.path.join(os.path.dirname(os.path.dirname(__file__)), "feeds.json")
+DEFAULT_LIMIT = 10  # entries taken per feed per fetch
+
+class Feed(NamedTuple):
+    source: str
+    url: str
+    translate: bool = True  # False for sources already in Chinese (or meant to stay as published)
+    limit: int = DEFAULT_LIMIT
+
+_feeds: Optional[List[Feed]] = None
+
+def feeds() -> List[Feed]:
+    global _feeds
+    if _feeds is None:
+        with open(FEEDS_FILE, "r", encoding="utf-8") as f:
+            items = [Feed(**x) for x in json.load(f).get("feeds", [])]
+        names = [x.source for x in items]
+        if len(names) != len(set(names)):
+            raise ValueError(f"duplicate feed sources in {FEEDS_FILE}")
+        _feeds = items
+    return _feeds
@@ -0,0 +1,199 @@
+
+import os
+import re
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Dict, Any, Optional
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from modules import metrics
+
+# One keep-alive session shared by every data source: per-host connection
+# pools, jittered-backoff retries for idempotent requests, per-source timeouts.
+SOURCE_TIMEOUTS = {"wb_panel": 25, "te": 25, "yahoo": 20, "deepl": 20, "rss": 15}
+DEFAULT_TIMEOUT = 20
+POOL_HOSTS = 16   # distinct hosts kept in the pool manager
+POOL_SIZE = 32    # connections per host, sized to the fetch thread pool
+
+_retry = Retry(
+    total=3,
+    connect=2,
+    read=2,
+    status=2,
+    backoff_factor=0.5,
+    backoff_jitter=0.5,
+    status_forcelist=(429, 500, 502, 503, 504),
+    allowed_methods=frozenset({"GET", "HEAD"}),  # never retry POST (e.g. DeepL)
+    respect_retry_after_header=True,
+    raise_on_status=False,
+)
+
+_session: Optional[requests.Session] = None
+_lock = threading.Lock()
+
+def get_session() -> requests.Session:
+    global _session
+    with _lock:
+        if _session is None:
+            s = requests.Session()
+            adapter = HTTPAdapter(pool_connections=POOL_HOSTS, pool_maxsize=POOL_SIZE, max_retries=_retry)
+            s.mount("https://", adapter)
+            s.mount("http://", adapter)
+            _session = s
+        return _session
+
+def _timeout(source: Optional[str], timeout: Optional[float]) -> float:
+    if timeout is not None:
+        return timeout
+    return SOURCE_TIMEOUTS.get(source, DEFAULT_TIMEOUT)
+
+# ---------------- Error text ----------------
+# requests/urllib3 messages embed the request URL ("... for url: https://host/path?client=..&secret=..",
+# "Max retries exceeded with url: /path?..."), and query strings carry API keys.
+# Anything that stores or serves an error message goes through redact_error.
+_QUERY = re.compile(r"\?[^\s'\"()<>]*")
+
+def redact_error(exc: BaseException) -> str:
+    return _QUERY.sub("?…", f"{type(exc).__name__}: {exc}")
+
+# ---------------- Circuit breakers ----------------
+# One breaker per host. After BREAKER_FAILURES consecutive failures (connection
+# errors, timeouts, 429/5xx) the host is "open": calls fail immediately with
+# CircuitOpenError instead of waiting out the timeout. After the cooldown a
+# single half-open probe is let through; success closes the breaker, failure
+# re-opens it with a doubled cooldown (capped).
+BREAKER_FAILURES = int(os.getenv("BREAKER_FAILURES", "3"))
+BREAKER_COOLDOWN = float(os.getenv("BREAKER_COOLDOWN_SECONDS", "30"))
+BREAKER_MAX_COOLDOWN = float(os.getenv("BREAKER_MAX_COOLDOWN_SECONDS", "600"))
+
+class CircuitOpenError(requests.ConnectionError):
+    pass
+
+class CircuitBreaker:
+    def __init__(self, host: str):
+        self.host = host
+        self.state = "closed"
+        self.failures = 0
+        self.cooldown = BREAKER_COOLDOWN
+        self.opened_at = 0.0
+        self.probing = False
+        self.rejected = 0
+        self._lock = threading.Lock()
+
+    def before(self):
+        with self._lock:
+            if self.state == "open" and time.monotonic() - self.opened_at >= self.cooldown:
+                self.state = "half_open"
+                self.probing = False
+            if self.state == "closed" or (self.state == "half_open" and not self.probing):
+                self.probing = self.state == "half_open"
+                return
+            self.rejected += 1
+        metrics.inc("breaker_rejected_total", host=self.host)
+        raise CircuitOpenError(f"circuit open for {self.host}")
+
+    def success(self):
+        with self._lock:
+            self.state, self.failures, self.probing, self.cooldown = "closed", 0, False, BREAKER_COOLDOWN
+
+    def failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == "half_open":
+                self.cooldown = min(self.cooldown * 2, BREAKER_MAX_COOLDOWN)
+            elif self.state != "closed" or self.failures < BREAKER_FAILURES:
+                return
+            self.state, self.opened_at, self.probing = "open", time.monotonic(), False
+        metrics.inc("breaker_opened_total", host=self.host)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"state": self.state, "failures": self.failures, "rejected": self.rejected,
+                    "cooldown_s": self.cooldown}
+
+_breakers: Dict[str, CircuitBreaker] = {}
+
+def _breaker(url: str) -> CircuitBreaker:
+    host = urlsplit(url).netloc
+    with _lock:
+        if host not in _breakers:
+            _breakers[host] = CircuitBreaker(host)
+        return _breakers[host]
+
+def breaker_stats() -> Dict[str, Dict[str, Any]]:
+    with _lock:
+        breakers = list(_breakers.values())
+    return {b.host: b.snapshot() for b in breakers}
+
+def _guarded(method: str, url: str, **kw) -> requests.Response:
+    b = _breaker(url)
+    b.before()
+    try:
+        r = get_session().request(method, url, **kw)
+    except BaseException:  # anything, not just RequestException: a half-open probe must always resolve
+        b.failure()
+        raise
+    if r.status_code == 429 or r.status_code >= 500:
+        b.failure()
+    else:
+        b.success()
+    return r
+
+# ---------------- Hedged requests ----------------
+# For slow idempotent GETs (Yahoo charts): if the first attempt hasn't answered
+# after HEDGE_AFTER[source] seconds, a second identical request is sent and
+# whichever returns first wins. The loser can't be interrupted; it finishes in
+# the background and its connection goes back to the pool. 0 disables.
+HEDGE_AFTER = {"yahoo": float(os.getenv("YAHOO_HEDGE_AFTER_SECONDS", "1.5"))}
+_hedge_pool = ThreadPoolExecutor(max_workers=int(os.getenv("HEDGE_WORKERS", "16")), thread_name_prefix="hedge")
+
+def _hedged(url: str, delay: float, **kw) -> requests.Response:
+    first = _hedge_pool.submit(_guarded, "GET", url, **kw)
+    done, _ = wait([first], timeout=delay)
+    if done:
+        return first.result()
+    metrics.inc("hedged_requests_total", host=urlsplit(url).netloc)
+    pending = {first, _hedge_pool.submit(_guarded, "GET", url, **kw)}
+    while True:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        ok = [f for f in done if f.exception() is None]
+        if ok or not pending:  # first success, or both failed: surface the error
+            return (ok or list(done))[0].result()
+
+def http_get(url: str, source: Optional[str] = None, params=None, timeout: Optional[float] = None, **kw) -> requests.Response:
+    kw.update(params=params, timeout=_timeout(source, timeout))
+    delay = HEDGE_AFTER.get(source, 0)
+    if delay > 0:
+        return _hedged(url, delay, **kw)
+    return _guarded("GET", url, **kw)
+
+def http_post(url: str, source: Optional[str] = None, data=None, timeout: Optional[float] = None, **kw) -> requests.Response:
+    return _guarded("POST", url, data=data, timeout=_timeout(source, timeout), **kw)
+
+def connection_stats() -> Dict[str, Dict[str, Any]]:
+    # Per host: requests sent vs. TCP/TLS connections opened; reused = requests that skipped a handshake.
+    out = {}
+    if _session is None:
+        return out
+    seen = set()
+    for adapter in _session.adapters.values():
+        if id(adapter) in seen:
+            continue
+        seen.add(id(adapter))
+        for key in list(adapter.poolmanager.pools.keys()):
+            pool = adapter.poolmanager.pools.get(key)
+            if pool is None:
+                continue
+            host = urlsplit(f"{key.key_scheme}://{key.key_host}").netloc
+            st = out.setdefault(host, {"requests": 0, "connections": 0})
+            st["requests"] += pool.num_requests
+            st["connections"] += pool.num_connections
+    for st in out.values():
+        st["reused"] = max(st["requests"] - st["connections"], 0)
+        st["reuse_ratio"] = round(st["reused"] / st["requests"], 3) if st["requests"] else 0.0
+    return out
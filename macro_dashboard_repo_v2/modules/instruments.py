@@ -0,0 +1,42 @@
+
+import os
+import json
+from typing import Dict, Any, List, NamedTuple, Optional
+
+# Declarative instrument registry: every market series the dashboard tracks
+# (indices, FX, ...) is one entry in instruments.json, so adding an instrument
+# is a config change. Cards in app.py are generated per (group, country).
+REGISTRY_FILE = os.getenv("INSTRUMENTS_FILE") or os.path.join(os.path.dirname(os.path.dirname(__file__)), "instruments.json")
+
+class Instrument(NamedTuple):
+    id: str
+    country: str
+    group: str
+    label: str
+    symbol: str
+    source: str = "yahoo"
+
+_registry: Optional[Dict[str, Any]] = None
+
+def _load() -> Dict[str, Any]:
+    global _registry
+    if _registry is None:
+        with open(REGISTRY_FILE, "r", encoding="utf-8") as f:
+            raw = json.load(f)
+        items = [Instrument(**x) for x in raw.get("instruments", [])]
+        ids = [i.id for i in items]
+        if len(ids) != len(set(ids)):
+            raise ValueError(f"duplicate instrument ids in {REGISTRY_FILE}")
+        _registry = {"countries": raw.get("countries", {}), "groups": raw.get("groups", {}), "instruments": items}
+    return _registry
+
+def instruments(group: Optional[str] = None, source: Optional[str] = None) -> List[Instrument]:
+    return [i for i in _load()["instruments"]
+            if (group is None or i.group == group) and (source is None or i.source == source)]
+
+def groups() -> Dict[str, Dict[str, str]]:
+    # group -> {"title", "format"}, in registry order
+    return _load()["groups"]
+
+def countries() -> Dict[str, str]:
+    return _load()["countries"]
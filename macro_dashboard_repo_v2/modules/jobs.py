@@ -0,0 +1,143 @@
+
+import os
+import json
+import time
+import uuid
+import threading
+from typing import Dict, Any, List, Optional, Callable, Tuple
+from datetime import datetime, timezone
+
+from modules.cache_store import CACHE_DIR, file_lock, write_atomic
+from modules.http_client import redact_error
+
+# Background jobs (refresh + email) run one at a time off the request path.
+# Job records are JSON files under cache/jobs: any gunicorn worker can enqueue
+# a job or answer /cron/status/<id>, but only the leader process runs them.
+JOBS_DIR = os.path.join(CACHE_DIR, "jobs")
+os.makedirs(JOBS_DIR, exist_ok=True)
+KEEP_JOBS = 50
+POLL_SECONDS = 2
+
+Step = Tuple[str, Callable[[Callable[[Dict[str, Any]], None]], Any]]
+
+_kinds: Dict[str, Callable[[], List[Step]]] = {}
+_wake = threading.Event()
+_runner: Optional[threading.Thread] = None
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+def _job_path(job_id: str) -> str:
+    return os.path.join(JOBS_DIR, f"{job_id}.json")
+
+def _write(job: Dict[str, Any]):
+    write_atomic(_job_path(job["id"]), job)
+
+def get_job(job_id: str) -> Optional[Dict[str, Any]]:
+    if not job_id.isalnum():
+        return None
+    try:
+        with open(_job_path(job_id), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def _list_jobs() -> List[Dict[str, Any]]:
+    jobs = [get_job(n[:-5]) for n in os.listdir(JOBS_DIR) if n.endswith(".json")]
+    return sorted((j for j in jobs if j), key=lambda j: j["created"])
+
+def _prune():
+    files = sorted((os.path.join(JOBS_DIR, n) for n in os.listdir(JOBS_DIR) if n.endswith(".json")),
+                   key=os.path.getmtime)
+    for p in files[:-KEEP_JOBS]:
+        try:
+            os.remove(p)
+        except OSError:
+            pass
+
+def register_job_kind(kind: str, steps: Callable[[], List[Step]]):
+    _kinds[kind] = steps
+
+def submit_job(kind: str) -> str:
+    # A job of the same kind already queued/running (in any worker) is reused instead of stacking another.
+    with file_lock("jobs"):
+        for job in _list_jobs():
+            if job["kind"] == kind and job["state"] in ("queued", "running"):
+                return job["id"]
+        job = {"id": uuid.uuid4().hex[:12], "kind": kind, "state": "queued", "created": _now(),
+               "started": None, "finished": None, "errors": [],
+               "steps": {name: {"state": "pending"} for name, _ in _kinds[kind]()}}
+        _write(job)
+    _wake.set()
+    return job["id"]
+
+def wait_job(job_id: str, timeout: Optional[float] = None) -> Optional[Dict[str, Any]]:
+    # Block until the job is done or failed (or the timeout passes); returns its last record
+    end = None if timeout is None else time.monotonic() + timeout
+    while True:
+        job = get_job(job_id)
+        if job is None or job["state"] in ("done", "failed") or (end is not None and time.monotonic() >= end):
+            return job
+        time.sleep(0.1)
+
+def _run(job: Dict[str, Any], steps: List[Step]):
+    job["state"] = "running"; job["started"] = _now()
+    _write(job)
+    try:
+        for name, fn in steps:
+            step = job["steps"][name]
+            step["state"] = "running"
+            _write(job)
+            def report(info: Dict[str, Any], step=step):
+                step.setdefault("progress", {}).update(info)
+                _write(job)
+            t0 = time.monotonic()
+            try:
+                step["result"] = fn(report)
+                step["state"] = "done"
+            except Exception as e:
+                step["state"] = "failed"
+                step["error"] = redact_error(e)  # job records are served by /cron/status
+                job["errors"].append(f"{name}: {step['error']}")
+            step["duration_s"] = round(time.monotonic() - t0, 3)
+            _write(job)
+        job["state"] = "failed" if job["errors"] else "done"
+    finally:
+        job["finished"] = _now()
+        _write(job)
+        _prune()
+
+def _abandon(job: Dict[str, Any], exc: Exception):
+    job["state"] = "failed"; job["finished"] = _now()
+    job.setdefault("errors", []).append(f"runner: {redact_error(exc)}")
+    try:
+        _write(job)
+    except Exception as e:
+        print("Job runner could not record failure:", job.get("id"), redact_error(e))
+
+def _run_queued():
+    while True:
+        _wake.wait(POLL_SECONDS)
+        _wake.clear()
+        for job in _list_jobs():
+            if job["state"] == "queued" and job["kind"] in _kinds:
+                # One bad job (e.g. queued by another code version, or a failed write)
+                # must not kill the runner: submit_job would keep handing out its id.
+                try:
+                    _run(job, _kinds[job["kind"]]())
+                except Exception as e:
+                    _abandon(job, e)
+
+def start_job_runner():
+    # Leader only. Jobs left "running" by a previous leader that died are marked failed.
+    global _runner
+    if _runner is not None:
+        return
+    with file_lock("jobs"):
+        for job in _list_jobs():
+            if job["state"] == "running":
+                job["state"] = "failed"; job["finished"] = _now()
+                job["errors"].append("interrupted: leader process exited")
+                _write(job)
+    _runner = threading.Thread(target=_run_queued, name="job-runner", daemon=True)
+    _runner.start()
@@ -0,0 +1,57 @@
+
+import time
+import importlib
+import threading
+from types import ModuleType
+from typing import Dict, Iterable
+
+# Deferred imports for the cold-start path: `pd = lazy_import("pandas")`
+# binds a stand-in whose first attribute access does the real import. A
+# worker can then answer its first request before pandas/numpy/pyarrow and
+# the modules built on them are loaded, and warm() pulls them in off the
+# request path. Timings of every deferred load are kept for the startup report.
+_loaded: Dict[str, float] = {}  # module name -> seconds spent importing it
+_lock = threading.Lock()
+
+class LazyModule(ModuleType):
+    def __init__(self, name: str):
+        super().__init__(name)
+        self.__dict__["_module"] = None
+
+    def _load(self) -> ModuleType:
+        mod = self.__dict__["_module"]
+        if mod is None:
+            t0 = time.perf_counter()
+            mod = importlib.import_module(self.__name__)  # the import lock makes concurrent first uses safe
+            with _lock:
+                _loaded.setdefault(self.__name__, time.perf_counter() - t0)
+            self.__dict__["_module"] = mod
+        return mod
+
+    def __getattr__(self, attr: str):
+        return getattr(self._load(), attr)
+
+    def __dir__(self):
+        return dir(self._load())
+
+    def __repr__(self):
+        state = "loaded" if self.__dict__["_module"] is not None else "deferred"
+        return f"<lazy module {self.__name__!r} ({state})>"
+
+def lazy_import(name: str) -> LazyModule:
+    return LazyModule(name)
+
+def warm(names: Iterable[str]) -> Dict[str, float]:
+    # Import the given modules now (e.g. from a background thread) and return per-module seconds.
+    out = {}
+    for name in names:
+        t0 = time.perf_counter()
+        importlib.import_module(name)
+        out[name] = round(time.perf_counter() - t0, 4)
+        with _lock:
+            _loaded.setdefault(name, out[name])
+    return out
+
+def load_times() -> Dict[str, float]:
+    with _lock:
+        return {k: round(v, 4) for k, v in _loaded.items()}
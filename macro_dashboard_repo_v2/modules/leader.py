@@ -0,0 +1,40 @@
+
+import os
+import threading
+from typing import Callable
+
+from modules.cache_store import try_file_lock
+
+# Every gunicorn worker imports app.py; an exclusive flock on cache/leader.lock
+# picks exactly one of them to run the scheduler and refreshes. The OS drops
+# the lock when that process dies, and the followers' retry loop takes over.
+RETRY_SECONDS = int(os.getenv("LEADER_RETRY_SECONDS", "30"))
+
+_fh = None
+_elected = threading.Event()
+
+def _try_lock() -> bool:
+    global _fh
+    fh = try_file_lock("leader")
+    if fh is None:
+        return False
+    fh.seek(0); fh.truncate(); fh.write(str(os.getpid())); fh.flush()
+    _fh = fh  # keep the descriptor open for the life of the process
+    return True
+
+def is_leader() -> bool:
+    return _elected.is_set()
+
+def start_leader_election(on_elected: Callable[[], None]) -> bool:
+    # Returns True if this process became leader right away; otherwise keeps retrying in the background.
+    if _try_lock():
+        _elected.set()
+        on_elected()
+        return True
+    def retry():
+        while not _elected.wait(RETRY_SECONDS):
+            if _try_lock():
+                _elected.set()
+                on_elected()
+    threading.Thread(target=retry, name="leader-election", daemon=True).start()
+    return False
@@ -0,0 +1,242 @@
+
+import os
+import time
+import queue
+import sqlite3
+import smtplib
+import threading
+from email.mime.text import MIMEText
+from email.mime.multipart import MIMEMultipart
+from email.utils import formataddr
+from contextlib import closing
+from collections import defaultdict
+from typing import Dict, Any, List, Iterable, Optional, Callable, NamedTuple, Tuple
+
+from modules import metrics
+from modules.http_client import redact_error
+from modules.cache_store import CACHE_DIR
+
+# ---------------- Delivery ledger ----------------
+# One row per (run, recipient). A run id identifies one digest (e.g. the
+# day's summary), so re-running it only sends to recipients not yet marked
+# "sent". Rows are flipped to "sending" right before handing them to a
+# provider; rows left in that state by a crash, or marked "unknown" after a
+# transport error with no response, are reported but not retried
+# automatically, so an accepted-but-unrecorded batch is never sent twice.
+# Each row also records the recipient's segment (content variant, see
+# modules/digest), so a resumed run sends the same variant it queued.
+LEDGER_DB = os.path.join(CACHE_DIR, "email_ledger.sqlite3")
+SENDGRID_BATCH = 1000  # SendGrid's personalizations-per-request limit
+SMTP_POOL = int(os.getenv("SMTP_POOL_SIZE", "4"))
+LEDGER_CHUNK = 5000
+
+def _ledger() -> sqlite3.Connection:
+    conn = sqlite3.connect(LEDGER_DB, timeout=30)
+    conn.execute("CREATE TABLE IF NOT EXISTS deliveries (run_id TEXT NOT NULL, recipient TEXT NOT NULL, "
+                 "status TEXT NOT NULL, provider TEXT, attempts INTEGER NOT NULL DEFAULT 0, error TEXT, "
+                 "updated REAL NOT NULL, PRIMARY KEY (run_id, recipient))")
+    cols = {r[1] for r in conn.execute("PRAGMA table_info(deliveries)")}
+    if "segment" not in cols:  # ledgers written before segmented digests
+        try:
+            conn.execute("ALTER TABLE deliveries ADD COLUMN segment TEXT NOT NULL DEFAULT ''")
+        except sqlite3.OperationalError:
+            pass  # another worker added it first
+    return conn
+
+class Message(NamedTuple):
+    subject: str
+    html: str
+    text: str = ""  # plain-text alternative; omitted from the email when empty
+
+def _enqueue(run_id: str, recipients: Iterable[Tuple[str, str]]):
+    # recipients: (address, segment) pairs
+    now = time.time()
+    sql = "INSERT OR IGNORE INTO deliveries (run_id, recipient, segment, status, updated) VALUES (?, ?, ?, 'pending', ?)"
+    with closing(_ledger()) as conn, conn:
+        batch = []
+        for r, seg in recipients:
+            batch.append((run_id, r, seg, now))
+            if len(batch) >= LEDGER_CHUNK:
+                conn.executemany(sql, batch)
+                batch = []
+        conn.executemany(sql, batch)
+
+def _claim(run_id: str, limit: int, provider: str, since: float) -> List[Tuple[str, str]]:
+    # Atomically move up to `limit` rows to "sending": pending ones, plus ones
+    # that failed before this provider pass started (so a pass never spins on its own failures).
+    with closing(_ledger()) as conn, conn:
+        conn.execute("BEGIN IMMEDIATE")
+        rows = conn.execute("SELECT recipient, segment FROM deliveries WHERE run_id=? AND "
+                            "(status='pending' OR (status='failed' AND updated<?)) LIMIT ?",
+                            (run_id, since, limit)).fetchall()
+        conn.executemany("UPDATE deliveries SET status='sending', provider=?, attempts=attempts+1, updated=? "
+                         "WHERE run_id=? AND recipient=?", [(provider, time.time(), run_id, r) for r, _ in rows])
+    return rows
+
+def _by_segment(rows: List[Tuple[str, str]]) -> Dict[str, List[str]]:
+    out = defaultdict(list)
+    for r, seg in rows:
+        out[seg].append(r)
+    return out
+
+def _mark(run_id: str, recipients: List[str], status: str, error: Optional[str] = None):
+    with closing(_ledger()) as conn, conn:
+        conn.executemany("UPDATE deliveries SET status=?, error=?, updated=? WHERE run_id=? AND recipient=?",
+                         [(status, error, time.time(), run_id, r) for r in recipients])
+
+def delivery_summary(run_id: str) -> Dict[str, int]:
+    with closing(_ledger()) as conn:
+        return dict(conn.execute("SELECT status, COUNT(*) FROM deliveries WHERE run_id=? GROUP BY status", (run_id,)))
+
+# ---------------- Providers ----------------
+def _sendgrid_batches(run_id: str, compose: Callable[[str], Message]) -> int:
+    key = os.getenv("SENDGRID_API_KEY")
+    sender = os.getenv("EMAIL_SENDER")  # e.g., no-reply@yourdomain.com
+    if not key or not sender:
+        return 0
+    import sendgrid
+    from sendgrid.helpers.mail import Mail, Email, To
+    sg = sendgrid.SendGridAPIClient(api_key=key, host=os.getenv("SENDGRID_API_HOST", "https://api.sendgrid.com"))
+    sent, since = 0, time.time()
+    while True:
+        claimed = _claim(run_id, SENDGRID_BATCH, "sendgrid", since)
+        if not claimed:
+            return sent
+        for seg, batch in _by_segment(claimed).items():
+            msg = compose(seg)
+            # is_multiple: one personalization per recipient, so nobody sees the other addresses
+            message = Mail(from_email=Email(sender), to_emails=[To(r) for r in batch], subject=msg.subject,
+                           html_content=msg.html, plain_text_content=msg.text or None, is_multiple=True)
+            # Only a definite HTTP error response means SendGrid didn't take the batch. A
+            # transport error (timeout, reset) may come after it was accepted, so those rows
+            # go to "unknown" like a crash would, rather than "failed" for SMTP to resend.
+            try:
+                with metrics.span("email_sendgrid"):
+                    resp = sg.client.mail.send.post(request_body=message.get())
+                code, err = resp.status_code, None
+            except Exception as e:
+                code = getattr(e, "status_code", None)  # python_http_client raises HTTPError for 4xx/5xx
+                err = redact_error(e)
+            if code is not None and 200 <= code < 300:
+                status, err = "sent", None
+            elif code is not None:
+                status, err = "failed", err or f"HTTP {code}"
+            else:
+                status = "unknown"
+            _mark(run_id, batch, status, err)
+            sent += len(batch) if status == "sent" else 0
+
+def _smtp_connect(host: str, port: int, user: Optional[str], pwd: Optional[str]) -> smtplib.SMTP:
+    s = smtplib.SMTP(host, port, timeout=20)
+    if os.getenv("SMTP_STARTTLS", "1") != "0":
+        s.starttls()
+    if user and pwd:
+        s.login(user, pwd)
+    return s
+
+def _smtp_close(conn: smtplib.SMTP):
+    try:
+        conn.close()
+    except Exception:
+        pass
+
+def _smtp_ready(conn: Optional[smtplib.SMTP], host: str, port: int, user: Optional[str], pwd: Optional[str]) -> smtplib.SMTP:
+    # The pooled connection, checked with NOOP so a dropped one is replaced before any of the message is sent
+    if conn is not None:
+        try:
+            if conn.noop()[0] == 250:
+                return conn
+        except Exception:
+            pass
+        _smtp_close(conn)
+    return _smtp_connect(host, port, user, pwd)
+
+def _mime_parts(msg: Message) -> List[MIMEText]:
+    # Bodies encoded once per segment and shared by every recipient's envelope
+    # (serializing a message doesn't modify its parts). Plain text goes first:
+    # in multipart/alternative the last part is the preferred one.
+    if not msg.text:
+        return []
+    return [MIMEText(msg.text, "plain", "utf-8"), MIMEText(msg.html, "html", "utf-8")]
+
+def _smtp_pool(run_id: str, compose: Callable[[str], Message]) -> int:
+    host = os.getenv("SMTP_HOST")
+    port = int(os.getenv("SMTP_PORT","587"))
+    user = os.getenv("SMTP_USER")
+    pwd = os.getenv("SMTP_PASS")
+    sender = os.getenv("EMAIL_SENDER") or user
+    if not (host and sender):
+        return 0
+    work: "queue.Queue" = queue.Queue(maxsize=SMTP_POOL * 50)  # (recipient, Message, shared MIME parts)
+    counts = {"sent": 0}
+    lock = threading.Lock()
+
+    def worker():
+        conn = None
+        while True:
+            item = work.get()
+            if item is None:
+                break
+            to, m, parts = item
+            # Fresh envelope and headers per recipient; only the encoded bodies are shared
+            msg = MIMEMultipart("alternative", _subparts=parts) if parts else MIMEText(m.html, "html", "utf-8")
+            msg["From"] = formataddr(("Macro Dashboard", sender))
+            msg["To"] = to
+            msg["Subject"] = m.subject
+            # Reconnecting is only safe before the transaction starts: once sendmail is
+            # under way the server may have accepted the message, so an error there
+            # leaves the row "unknown" (like SendGrid transport errors) instead of resending.
+            try:
+                conn = _smtp_ready(conn, host, port, user, pwd)
+            except Exception as e:  # nothing was sent; a later run retries the row
+                conn, status, err = None, "failed", redact_error(e)
+            else:
+                try:
+                    with metrics.span("email_smtp"):
+                        conn.sendmail(sender, [to], msg.as_string())
+                    status, err = "sent", None
+                except (smtplib.SMTPRecipientsRefused, smtplib.SMTPResponseException) as e:  # server rejected it
+                    status, err = "failed", redact_error(e)
+                except Exception as e:  # connection lost mid-transaction
+                    status, err = "unknown", redact_error(e)
+                    _smtp_close(conn)
+                    conn = None
+            _mark(run_id, [to], status, err)
+            if status == "sent":
+                with lock:
+                    counts["sent"] += 1
+        if conn is not None:
+            try:
+                conn.quit()
+            except Exception:
+                pass
+
+    threads = [threading.Thread(target=worker, name=f"smtp-{i}", daemon=True) for i in range(SMTP_POOL)]
+    for t in threads:
+        t.start()
+    prepared: Dict[str, Tuple[Message, List[MIMEText]]] = {}  # segment -> (message, encoded parts)
+    since = time.time()
+    while True:
+        batch = _claim(run_id, SMTP_POOL * 50, "smtp", since)
+        if not batch:
+            break
+        for to, seg in batch:
+            if seg not in prepared:
+                m = compose(seg)
+                prepared[seg] = (m, _mime_parts(m))
+            work.put((to, *prepared[seg]))
+    for _ in threads:
+        work.put(None)
+    for t in threads:
+        t.join()
+    return counts["sent"]
+
+def deliver(run_id: str, recipients: Iterable[Tuple[str, str]], compose: Callable[[str], Message]) -> Dict[str, Any]:
+    # recipients: (address, segment) pairs; compose(segment) returns that segment's
+    # message. It is called from this thread only, repeatedly, so it should memoize (Digest.message does).
+    # SendGrid first (bulk personalizations); anything still unsent falls through to SMTP.
+    _enqueue(run_id, recipients)
+    sent = _sendgrid_batches(run_id, compose)
+    sent += _smtp_pool(run_id, compose)
+    metrics.flush()
+    return {"run_id": run_id, "sent": sent, "ledger": delivery_summary(run_id)}
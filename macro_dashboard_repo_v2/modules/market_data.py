@@ -0,0 +1,98 @@
+
+import os
+from urllib.parse import quote
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from modules.http_client import http_get
+
+# Market data engine: daily closes for many symbols per request (Yahoo spark,
+# SPARK_CHUNK symbols per call, chunks fetched concurrently by the caller),
+# aligned into one date x instrument matrix so changes, rolling volatility and
+# z-scores are computed for every instrument in a single vectorized pass.
+YAHOO_BASE = os.getenv("YAHOO_BASE_URL", "https://query1.finance.yahoo.com")
+SPARK_CHUNK = 20          # symbols per spark request (Yahoo's limit)
+HISTORY_RANGE = "3mo"     # enough daily closes for the rolling windows below
+VOL_WINDOW = 20           # trading days
+Z_WINDOW = 20
+TRADING_DAYS = 252
+
+Series = Tuple[List[int], List[Optional[float]]]  # (unix timestamps, closes)
+
+def yahoo_chart(symbol: str, range_: str = "5d") -> Series:
+    url = f"{YAHOO_BASE}/v8/finance/chart/{quote(symbol)}?range={range_}&interval=1d"
+    r = http_get(url, "yahoo")
+    r.raise_for_status()
+    res = r.json()["chart"]["result"][0]
+    return res.get("timestamp") or [], res["indicators"]["quote"][0]["close"]
+
+def _parse_spark(j) -> Dict[str, Series]:
+    out = {}
+    if isinstance(j, dict) and "spark" in j:  # v7: {"spark": {"result": [{"symbol", "response": [chart]}]}}
+        for item in (j["spark"] or {}).get("result") or []:
+            resp = (item.get("response") or [None])[0]
+            if resp and resp.get("timestamp"):
+                out[item["symbol"]] = (resp["timestamp"], resp["indicators"]["quote"][0]["close"])
+    elif isinstance(j, dict):  # v8: {symbol: {"timestamp", "close"}}
+        for sym, v in j.items():
+            if isinstance(v, dict) and v.get("timestamp"):
+                out[sym] = (v["timestamp"], v["close"])
+    return out
+
+def yahoo_spark(symbols: List[str], range_: str = HISTORY_RANGE) -> Dict[str, Series]:
+    # One request for up to SPARK_CHUNK symbols; any symbol the spark response
+    # lacks (or all of them, if the call fails) falls back to its own chart call.
+    out: Dict[str, Series] = {}
+    try:
+        r = http_get(f"{YAHOO_BASE}/v7/finance/spark", "yahoo",
+                     params={"symbols": ",".join(symbols), "range": range_, "interval": "1d"})
+        r.raise_for_status()
+        out = _parse_spark(r.json())
+    except Exception as e:
+        print("spark failed, falling back to chart:", e)
+    for s in symbols:
+        if s not in out:
+            try:
+                out[s] = yahoo_chart(s, range_)
+            except Exception:
+                pass  # reported as missing by the caller
+    return out
+
+def chunks(symbols: List[str], size: int = SPARK_CHUNK) -> List[List[str]]:
+    return [symbols[i:i + size] for i in range(0, len(symbols), size)]
+
+def closes_matrix(series: Dict[str, Series]) -> pd.DataFrame:
+    # date x key matrix of closes; NaN where a market was closed or a value is missing.
+    cols = {}
+    for key, (ts, closes) in series.items():
+        if not ts:
+            continue
+        idx = pd.to_datetime(pd.Series(ts[:len(closes)]), unit="s").dt.normalize()
+        s = pd.Series(pd.to_numeric(pd.Series(closes[:len(idx)]), errors="coerce").to_numpy(), index=idx)
+        cols[key] = s[~s.index.duplicated(keep="last")]
+    if not cols:
+        return pd.DataFrame()
+    return pd.DataFrame(cols).sort_index()
+
+def market_stats(closes: pd.DataFrame) -> pd.DataFrame:
+    # Per column: last close, % change vs the previous available close,
+    # annualized rolling volatility of log returns (%), and the z-score of the
+    # last close against its rolling mean/std. Columns may have gaps on
+    # different days (holidays differ by market), so "last"/"previous" are
+    # picked per column from the valid cells rather than by row position.
+    cols = ["level", "change_pct", "vol_20d", "zscore"]
+    if closes.empty:
+        return pd.DataFrame(columns=cols)
+    valid = closes.notna()
+    rank_from_end = valid[::-1].cumsum()[::-1]
+    last = closes.where(valid & (rank_from_end == 1)).max()
+    prev = closes.where(valid & (rank_from_end == 2)).max()
+    filled = closes.ffill()
+    rets = np.log(filled).diff().where(valid)
+    vol = rets.rolling(VOL_WINDOW, min_periods=VOL_WINDOW // 2).std().iloc[-1] * np.sqrt(TRADING_DAYS) * 100
+    roll = filled.rolling(Z_WINDOW, min_periods=Z_WINDOW // 2)
+    z = (filled.iloc[-1] - roll.mean().iloc[-1]) / roll.std().iloc[-1]
+    out = pd.DataFrame({"level": last, "change_pct": (last / prev - 1.0) * 100.0, "vol_20d": vol, "zscore": z})
+    return out.replace([np.inf, -np.inf], np.nan)[cols]
@@ -0,0 +1,153 @@
+
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager
+from typing import Dict, Tuple, List
+
+from modules.cache_store import CACHE_DIR, write_atomic
+
+# Lightweight in-process counters and histograms, rendered in Prometheus text
+# format. Upstream calls happen in the leader process while /metrics can land
+# on any gunicorn worker, so each process flushes a snapshot to
+# cache/metrics/<pid>.json and /metrics sums all of them.
+METRICS_DIR = os.path.join(CACHE_DIR, "metrics")
+os.makedirs(METRICS_DIR, exist_ok=True)
+BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60)
+FLUSH_SECONDS = 5
+STALE_SECONDS = 7 * 86400  # snapshots of processes gone this long are dropped
+
+HELP = {
+    "source_calls_total": ("counter", "Upstream calls by source and outcome (success/failure/timeout)."),
+    "source_duration_seconds": ("histogram", "Upstream call duration by source."),
+    "refresh_duration_seconds": ("histogram", "Wall time of refresh_all_data."),
+    "breaker_opened_total": ("counter", "Times a host's circuit breaker opened."),
+    "breaker_rejected_total": ("counter", "Calls failed fast because the host's breaker was open."),
+    "hedged_requests_total": ("counter", "Hedge requests sent because the first attempt was slow."),
+    "te_cache_total": ("counter", "TradingEconomics response cache lookups (hit/miss)."),
+    "digest_renders_total": ("counter", "Email digest renders by kind (fragment/segment)."),
+}
+
+Labels = Tuple[Tuple[str, str], ...]
+
+_lock = threading.Lock()
+_flush_lock = threading.Lock()
+_counters: Dict[str, Dict[Labels, float]] = {}
+_hists: Dict[str, Dict[Labels, List[float]]] = {}  # per label set: bucket counts..., +Inf count, sum
+_last_flush = 0.0
+
+def _labels(labels: Dict[str, str]) -> Labels:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+def inc(name: str, value: float = 1, **labels):
+    with _lock:
+        series = _counters.setdefault(name, {})
+        key = _labels(labels)
+        series[key] = series.get(key, 0) + value
+    _maybe_flush()
+
+def observe(name: str, seconds: float, **labels):
+    with _lock:
+        series = _hists.setdefault(name, {})
+        h = series.setdefault(_labels(labels), [0] * (len(BUCKETS) + 2))
+        for i, b in enumerate(BUCKETS):
+            if seconds <= b:
+                h[i] += 1
+        h[len(BUCKETS)] += 1
+        h[-1] += seconds
+    _maybe_flush()
+
+def record_call(source: str, outcome: str, seconds: float):
+    inc("source_calls_total", source=source, outcome=outcome)
+    observe("source_duration_seconds", seconds, source=source)
+
+@contextmanager
+def span(source: str):
+    # Times one upstream call and counts it as success/failure (exceptions propagate).
+    t0 = time.monotonic()
+    try:
+        yield
+    except Exception:
+        record_call(source, "failure", time.monotonic() - t0)
+        raise
+    record_call(source, "success", time.monotonic() - t0)
+
+def _snapshot() -> Dict[str, list]:
+    with _lock:
+        return {
+            "counters": [[n, list(map(list, k)), v] for n, s in _counters.items() for k, v in s.items()],
+            "hists": [[n, list(map(list, k)), list(h)] for n, s in _hists.items() for k, h in s.items()],
+        }
+
+def flush():
+    global _last_flush
+    with _flush_lock:
+        _last_flush = time.monotonic()
+        write_atomic(os.path.join(METRICS_DIR, f"{os.getpid()}.json"), _snapshot())
+
+def _maybe_flush():
+    if time.monotonic() - _last_flush > FLUSH_SECONDS:
+        try:
+            flush()
+        except OSError:
+            pass
+
+def _collect():
+    counters: Dict[str, Dict[Labels, float]] = {}
+    hists: Dict[str, Dict[Labels, List[float]]] = {}
+    now = time.time()
+    own = f"{os.getpid()}.json"
+    for n in os.listdir(METRICS_DIR):
+        if not n.endswith(".json") or n == own:
+            continue
+        p = os.path.join(METRICS_DIR, n)
+        try:
+            if now - os.path.getmtime(p) > STALE_SECONDS:
+                os.remove(p)
+                continue
+            with open(p, "r", encoding="utf-8") as f:
+                snap = json.load(f)
+        except (OSError, ValueError):
+            continue
+        _merge(counters, hists, snap)
+    _merge(counters, hists, _snapshot())  # this process: live values, not its last flush
+    return counters, hists
+
+def _merge(counters, hists, snap):
+    for name, labels, v in snap.get("counters", []):
+        key = tuple(map(tuple, labels))
+        s = counters.setdefault(name, {})
+        s[key] = s.get(key, 0) + v
+    for name, labels, h in snap.get("hists", []):
+        key = tuple(map(tuple, labels))
+        s = hists.setdefault(name, {})
+        cur = s.setdefault(key, [0] * len(h))
+        for i, v in enumerate(h):
+            cur[i] += v
+
+def _num(v) -> str:
+    return str(int(v)) if float(v).is_integer() else repr(float(v))
+
+def _fmt(labels: Labels, extra: Labels = ()) -> str:
+    items = list(labels) + list(extra)
+    if not items:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in items) + "}"
+
+def render_prometheus() -> str:
+    counters, hists = _collect()
+    lines = []
+    for name in sorted(set(counters) | set(hists)):
+        kind, text = HELP.get(name, ("untyped", name))
+        lines.append(f"# HELP {name} {text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for labels, v in sorted(counters.get(name, {}).items()):
+            lines.append(f"{name}{_fmt(labels)} {_num(v)}")
+        for labels, h in sorted(hists.get(name, {}).items()):
+            for i, b in enumerate(BUCKETS):
+                lines.append(f"{name}_bucket{_fmt(labels, (('le', f'{b:g}'),))} {_num(h[i])}")
+            lines.append(f"{name}_bucket{_fmt(labels, (('le', '+Inf'),))} {_num(h[len(BUCKETS)])}")
+            lines.append(f"{name}_sum{_fmt(labels)} {h[-1]:.6f}")
+            lines.append(f"{name}_count{_fmt(labels)} {_num(h[len(BUCKETS)])}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,127 @@
+
+import os
+import re
+import json
+import time
+import sqlite3
+from contextlib import closing
+from typing import Dict, Iterable, Iterator, Tuple
+
+from modules.cache_store import CACHE_DIR
+
+# Subscribers live in SQLite with a unique (case-insensitive) email key, so
+# subscribing is a single indexed insert and concurrent workers can't
+# overwrite each other's additions. The legacy email_recipients.json is
+# imported once on first use. Each subscriber also stores digest preferences
+# (comma-separated country and section keys, "" = all); together they form
+# the subscriber's segment, "<countries>|<sections>" (see modules/digest).
+SUBSCRIBERS_DB = os.path.join(CACHE_DIR, "subscribers.sqlite3")
+LEGACY_FILE = os.path.join(CACHE_DIR, "email_recipients.json")
+ITER_CHUNK = 1000
+
+def _valid_email(addr: str) -> bool:
+    return bool(re.match(r"^[^@\s]+@[^@\s]+\.[^@\s]+$", addr or ""))
+
+def _db() -> sqlite3.Connection:
+    conn = sqlite3.connect(SUBSCRIBERS_DB, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("CREATE TABLE IF NOT EXISTS subscribers (id INTEGER PRIMARY KEY, "
+                 "email TEXT NOT NULL UNIQUE COLLATE NOCASE, created REAL NOT NULL, "
+                 "countries TEXT NOT NULL DEFAULT '', sections TEXT NOT NULL DEFAULT '')")
+    cols = {r[1] for r in conn.execute("PRAGMA table_info(subscribers)")}
+    for col in ("countries", "sections"):
+        if col not in cols:  # databases created before preferences existed
+            try:
+                conn.execute(f"ALTER TABLE subscribers ADD COLUMN {col} TEXT NOT NULL DEFAULT ''")
+            except sqlite3.OperationalError:
+                pass  # another worker added it first
+    if os.path.exists(LEGACY_FILE):
+        _migrate_legacy(conn)
+    return conn
+
+def _migrate_legacy(conn: sqlite3.Connection):
+    try:
+        with open(LEGACY_FILE, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return
+    if isinstance(data, list):
+        with conn:
+            _insert_many(conn, data)
+    try:
+        os.replace(LEGACY_FILE, LEGACY_FILE + ".migrated")
+    except OSError:
+        pass  # another worker got there first
+
+def _insert_many(conn: sqlite3.Connection, addrs: Iterable[str]) -> int:
+    now = time.time()
+    before = conn.total_changes
+    conn.executemany("INSERT OR IGNORE INTO subscribers (email, created) VALUES (?, ?)",
+                     ((a.strip(), now) for a in addrs if _valid_email((a or "").strip())))
+    return conn.total_changes - before
+
+def add_subscriber(addr: str, countries: Iterable[str] = (), sections: Iterable[str] = ()) -> Tuple[bool, str]:
+    # Subscribing again with the same address updates its preferences
+    addr = (addr or "").strip()
+    if not _valid_email(addr):
+        return False, "邮箱格式不正确"
+    prefs = (",".join(countries), ",".join(sections))
+    with closing(_db()) as conn, conn:
+        cur = conn.execute("INSERT OR IGNORE INTO subscribers (email, created, countries, sections) VALUES (?, ?, ?, ?)",
+                           (addr, time.time(), *prefs))
+        if cur.rowcount:
+            return True, "OK"
+        cur = conn.execute("UPDATE subscribers SET countries = ?, sections = ? WHERE email = ? "
+                           "AND (countries != ? OR sections != ?)", (*prefs, addr, *prefs))
+    return True, "已更新" if cur.rowcount else "已订阅"
+
+def remove_subscriber(addr: str) -> bool:
+    with closing(_db()) as conn, conn:
+        return conn.execute("DELETE FROM subscribers WHERE email = ?", ((addr or "").strip(),)).rowcount > 0
+
+def is_subscribed(addr: str) -> bool:
+    with closing(_db()) as conn:
+        return conn.execute("SELECT 1 FROM subscribers WHERE email = ?", ((addr or "").strip(),)).fetchone() is not None
+
+def count_subscribers() -> int:
+    with closing(_db()) as conn:
+        return conn.execute("SELECT COUNT(*) FROM subscribers").fetchone()[0]
+
+def _iter_rows(chunk: int) -> Iterator[Tuple[str, str, str]]:
+    # Keyset pagination: constant memory, and no read transaction held open while the caller sends.
+    last = 0
+    while True:
+        with closing(_db()) as conn:
+            rows = conn.execute("SELECT id, email, countries, sections FROM subscribers WHERE id > ? ORDER BY id LIMIT ?",
+                                (last, chunk)).fetchall()
+        if not rows:
+            return
+        for row in rows:
+            yield row[1:]
+        last = rows[-1][0]
+
+def iter_subscribers(chunk: int = ITER_CHUNK) -> Iterator[str]:
+    for email, _, _ in _iter_rows(chunk):
+        yield email
+
+def iter_recipients(chunk: int = ITER_CHUNK) -> Iterator[Tuple[str, str]]:
+    # (email, segment) for every subscriber
+    for email, countries, sections in _iter_rows(chunk):
+        yield email, f"{countries}|{sections}"
+
+def segment_counts() -> Dict[str, int]:
+    with closing(_db()) as conn:
+        return {f"{c}|{s}": n for c, s, n in
+                conn.execute("SELECT countries, sections, COUNT(*) FROM subscribers GROUP BY countries, sections")}
+
+def import_subscribers(addrs: Iterable[str]) -> int:
+    with closing(_db()) as conn, conn:
+        return _insert_many(conn, addrs)
+
+def export_subscribers(path: str) -> int:
+    # One address per line
+    n = 0
+    with open(path, "w", encoding="utf-8") as f:
+        for email in iter_subscribers():
+            f.write(email + "\n"); n += 1
+    return n
@@ -0,0 +1,106 @@
+
+import os
+import time
+import threading
+from urllib.parse import quote
+from typing import Dict, Any, List, Optional, Tuple, Iterable
+
+from modules import metrics
+from modules.http_client import http_get
+
+# TradingEconomics query layer: multi-country requests in one call
+# ("country/china,united states,euro area"), an in-process response cache with
+# a TTL per endpoint, and a token bucket sized to the API plan so adding
+# countries can't push us into 429s. Responses are indexed by
+# (country, category/group) so assemblers do dict lookups, not list scans.
+TE_BASE = os.getenv("TE_BASE_URL", "https://api.tradingeconomics.com")
+TE_RATE = float(os.getenv("TE_RATE_PER_SECOND", "1"))  # sustained requests/second allowed by the plan
+TE_BURST = int(os.getenv("TE_RATE_BURST", "5"))
+TE_MAX_WAIT = 20  # seconds to wait for a token before giving up on a call
+# endpoint (first path segment) -> seconds a response stays fresh
+TTL = {"country": 1800, "bonds": 120}
+DEFAULT_TTL = 300
+
+def te_configured() -> bool:
+    return bool(os.getenv("TE_API_CLIENT_KEY") and os.getenv("TE_API_CLIENT_SECRET"))
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.capacity = max(burst, 1)
+        self.tokens = float(self.capacity)
+        self.stamp = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, max_wait: float = TE_MAX_WAIT) -> bool:
+        # Blocks until a token is free; False if that would take longer than max_wait.
+        deadline = time.monotonic() + max_wait
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.stamp) * self.rate)
+                self.stamp = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return True
+                wait = (1 - self.tokens) / self.rate
+            if now + wait > deadline:
+                return False
+            time.sleep(wait)
+
+def index_by(rows: Iterable[Dict[str, Any]], *fields: str) -> Dict[Tuple, Dict[str, Any]]:
+    # First row wins per key (TE lists the most relevant entry first).
+    out: Dict[Tuple, Dict[str, Any]] = {}
+    for r in rows:
+        out.setdefault(tuple(str(r.get(f) or "").lower() for f in fields), r)
+    return out
+
+class TEClient:
+    def __init__(self, base: str = TE_BASE, rate: float = TE_RATE, burst: int = TE_BURST):
+        self.base = base
+        self.bucket = TokenBucket(rate, burst)
+        self._cache: Dict[Tuple, Tuple[float, Any]] = {}  # (path, params) -> (expires, data)
+        self._lock = threading.Lock()
+        self.calls = 0
+
+    def get(self, path: str, params: Optional[Dict[str, str]] = None) -> Any:
+        key = os.getenv("TE_API_CLIENT_KEY")
+        secret = os.getenv("TE_API_CLIENT_SECRET")
+        if not key or not secret:
+            raise RuntimeError("TradingEconomics API keys not provided.")
+        params = dict(params or {})
+        ck = (path, tuple(sorted(params.items())))
+        with self._lock:
+            hit = self._cache.get(ck)
+        if hit and hit[0] > time.monotonic():
+            metrics.inc("te_cache_total", outcome="hit")
+            return hit[1]
+        metrics.inc("te_cache_total", outcome="miss")
+        if not self.bucket.acquire():
+            raise RuntimeError("TradingEconomics rate limit: no token available")
+        params.update({"client": key, "secret": secret, "format": "json"})
+        r = http_get(f"{self.base}/{path}", "te", params=params)
+        r.raise_for_status()
+        data = r.json()
+        ttl = TTL.get(path.split("/", 1)[0], DEFAULT_TTL)
+        with self._lock:
+            self.calls += 1
+            self._cache[ck] = (time.monotonic() + ttl, data)
+        return data
+
+    def countries(self, names: List[str], group: Optional[str] = None) -> Dict[Tuple, Dict[str, Any]]:
+        # Latest value of every indicator for all `names` in one request, keyed (country, category).
+        data = self.get("country/" + quote(",".join(n.lower() for n in names), safe=","),
+                        {"group": group} if group else None)
+        return index_by(data if isinstance(data, list) else [], "Country", "Category")
+
+    def bonds(self) -> Dict[Tuple, Dict[str, Any]]:
+        # Major government bonds keyed (country, tenor group), e.g. ("united states", "10y").
+        data = self.get("bonds/major")
+        return index_by(data if isinstance(data, list) else [], "Country", "Group")
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+te = TEClient()
@@ -0,0 +1,97 @@
+
+import os
+import json
+import threading
+from typing import Dict, List, Optional, Iterable
+
+import pandas as pd
+import pyarrow.parquet as pq
+
+from modules.cache_store import CACHE_DIR, file_lock, write_atomic
+
+# Append-only time-series store: cache/timeseries/<dataset>/<YYYY-MM>.parquet,
+# long format (series, ts, value), one observation per series per day.
+# A manifest keeps the last stored date of each series, so a refresh appends
+# only newer observations (the latest day may be overwritten, e.g. a
+# provisional close later replaced by the final one). Past months are never
+# rewritten. Range queries open only the months they overlap, memory-mapped,
+# with the series filter pushed down to the Parquet reader.
+TS_DIR = os.path.join(CACHE_DIR, "timeseries")
+MANIFEST = "_manifest.json"
+COLUMNS = ["series", "ts", "value"]
+
+_lock = threading.Lock()
+
+def _dir(dataset: str) -> str:
+    d = os.path.join(TS_DIR, dataset)
+    os.makedirs(d, exist_ok=True)
+    return d
+
+def _manifest(dataset: str) -> Dict[str, Dict[str, str]]:
+    try:
+        with open(os.path.join(_dir(dataset), MANIFEST), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {"last": {}}
+
+def _normalize(df: pd.DataFrame) -> pd.DataFrame:
+    df = df[COLUMNS].dropna(subset=["value"]).copy()
+    df["series"] = df["series"].astype(str)
+    df["ts"] = pd.to_datetime(df["ts"]).dt.normalize().astype("datetime64[ns]")
+    df["value"] = df["value"].astype("float64")
+    return df.drop_duplicates(["series", "ts"], keep="last")
+
+def append(dataset: str, obs: pd.DataFrame) -> int:
+    # obs: columns series, ts, value. Returns the number of rows written.
+    if obs is None or obs.empty:
+        return 0
+    obs = _normalize(obs)
+    with _lock, file_lock(f"ts-{dataset}"):
+        man = _manifest(dataset)
+        last = pd.to_datetime(obs["series"].map(man["last"]))
+        new = obs[last.isna() | (obs["ts"] >= last)]
+        if new.empty:
+            return 0
+        d = _dir(dataset)
+        for month, part in new.groupby(new["ts"].dt.strftime("%Y-%m")):
+            p = os.path.join(d, f"{month}.parquet")
+            if os.path.exists(p):
+                part = pd.concat([pq.read_table(p).to_pandas(), part], ignore_index=True)
+            part = part.drop_duplicates(["series", "ts"], keep="last").sort_values(["series", "ts"])
+            write_atomic(p, part)
+        for s, ts in new.groupby("series")["ts"].max().items():
+            man["last"][s] = max(man["last"].get(s, ""), ts.strftime("%Y-%m-%d"))
+        write_atomic(os.path.join(d, MANIFEST), man)
+        return len(new)
+
+def series_names(dataset: str) -> List[str]:
+    return sorted(_manifest(dataset)["last"])
+
+def _months(dataset: str, start: Optional[pd.Timestamp], end: Optional[pd.Timestamp]) -> List[str]:
+    d = _dir(dataset)
+    names = sorted(n for n in os.listdir(d) if n.endswith(".parquet"))
+    lo = start.strftime("%Y-%m") if start is not None else ""
+    hi = end.strftime("%Y-%m") if end is not None else "9999-99"
+    return [os.path.join(d, n) for n in names if lo <= n[:7] <= hi]
+
+def query(dataset: str, series: Optional[Iterable[str]] = None, start=None, end=None) -> pd.DataFrame:
+    # Long frame (series, ts, value) for [start, end], sorted by series then ts.
+    start = pd.Timestamp(start) if start is not None else None
+    end = pd.Timestamp(end) if end is not None else None
+    filters = [("series", "in", list(series))] if series is not None else None
+    frames = [pq.read_table(p, filters=filters, memory_map=True).to_pandas() for p in _months(dataset, start, end)]
+    frames = [f for f in frames if len(f)]
+    if not frames:
+        return pd.DataFrame({"series": pd.Series(dtype=str), "ts": pd.Series(dtype="datetime64[ns]"),
+                             "value": pd.Series(dtype="float64")})
+    df = pd.concat(frames, ignore_index=True)
+    if start is not None:
+        df = df[df["ts"] >= start]
+    if end is not None:
+        df = df[df["ts"] <= end]
+    return df.sort_values(["series", "ts"]).reset_index(drop=True)
+
+def query_wide(dataset: str, series: Optional[Iterable[str]] = None, start=None, end=None) -> pd.DataFrame:
+    # Date x series matrix, e.g. for charts
+    df = query(dataset, series, start, end)
+    return df.pivot(index="ts", columns="series", values="value").sort_index()
@@ -1,10 +1,17 @@
 
-def create_card(title, kv_dict):
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+from modules.instruments import instruments, groups
+
+def create_card(title, kv_dict, ids=None):
+    # ids: optional {key: DOM id} for value spans that live mode patches in place
     from dash import html
     import dash_bootstrap_components as dbc
     rows = []
     for k, v in kv_dict.items():
-        rows.append(html.Div([html.Span(str(k)), html.Span(str(v) if v is not None else "—", className="float-end")],
+        value = {"id": ids[k]} if ids and k in ids else {}
+        rows.append(html.Div([html.Span(str(k)), html.Span(str(v) if v is not None else "—", className="float-end", **value)],
                              className="py-1 border-bottom"))
     body = dbc.CardBody([html.H6(title, className="card-title"), *rows])
     return dbc.Card(body, className="shadow-sm h-100")
@@ -20,3 +27,55 @@ def bp_fmt(x):
         return f"{x:+.0f}bp"
     except Exception:
         return "—"
+
+# Display rows shared by the page cards and the email digest, so both show the
+# same numbers: (key, label, text), text None when the value is missing.
+MACRO_FIELDS = [("GDP增速(同比,%)", "gdp_yoy"), ("CPI(同比,%)", "cpi_yoy"), ("PPI(同比,%)", "ppi_yoy"), ("政策利率(%)", "policy_rate")]
+BOND_TENORS = [("1Y", "1y"), ("5Y", "5y"), ("10Y", "10y")]
+CARRIED = "_carried"  # snapshot key: {country: {key: UTC ISO time}} for values kept from an earlier refresh
+TZ = ZoneInfo("Asia/Shanghai")
+
+def _as_of(snapshot, country_key, key, s):
+    # A value carried forward from an earlier refresh shows the date it was fetched
+    at = (snapshot.get(CARRIED) or {}).get(country_key, {}).get(key)
+    if s is None or not at:
+        return s
+    return f"{s}（截至{datetime.fromisoformat(at).astimezone(TZ):%m-%d}）"
+
+def macro_rows(macro, country_key):
+    block = macro.get(country_key, {})
+    return [(key, label, _as_of(macro, country_key, key, None if block.get(key) is None else f"{block[key]:.2f}"))
+            for label, key in MACRO_FIELDS]
+
+def bonds_rows(bonds, country_key):
+    block = bonds.get(country_key, {})
+    rows = []
+    for label, k in BOND_TENORS:
+        v = block.get(k, {})
+        val = v.get("value")
+        chg = v.get("change_bp")
+        s = None
+        if val is not None:
+            s = f"{val:.2f}%"
+            if chg is not None:
+                s += f" ({bp_fmt(chg)})"
+        rows.append((k, label, _as_of(bonds, country_key, k, s)))
+    return rows
+
+def market_rows(market, group, country_key):
+    block = market.get(country_key, {})
+    fmt = groups()[group].get("format", "{:,.2f}")
+    rows = []
+    for inst in instruments(group=group):
+        if inst.country != country_key:
+            continue
+        v = block.get(inst.id, {})
+        lvl = v.get("level")
+        chg = v.get("change_pct")
+        s = None
+        if lvl is not None:
+            s = fmt.format(lvl)
+            if chg is not None:
+                s += f" ({pct_fmt(chg)})"
+        rows.append((inst.id, inst.label, _as_of(market, country_key, inst.id, s)))
+    return rows